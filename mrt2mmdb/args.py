@@ -94,7 +94,56 @@ def ipaddress_arg(parser):
 def asn_arg(parser):
     """define arguments to be added"""
     return parser.add_argument(
-        "--asn", metavar="", type=str, help="ASN lookup", default=""
+        "--asn",
+        metavar="",
+        type=str,
+        help="ASN lookup (comma separated for many ASN)",
+        default="",
+    )
+
+
+def serve_arg(parser):
+    """define arguments to be added"""
+    return parser.add_argument(
+        "--serve",
+        metavar="",
+        type=str,
+        help="Serve json lookups on host:port or on a unix socket (unix:<path>)",
+        default="",
+    )
+
+
+def batch_arg(parser):
+    """define arguments to be added"""
+    return parser.add_argument(
+        "--batch",
+        metavar="",
+        type=str,
+        help="Lookup the ip addresses of a file (one per line, - for stdin)",
+        default="",
+    )
+
+
+def output_format_arg(parser):
+    """define arguments to be added"""
+    return parser.add_argument(
+        "--format",
+        metavar="",
+        type=str,
+        choices=["ndjson", "json", "csv"],
+        help="Output format of --batch [ndjson|csv] and --display [ndjson|json|csv]\
+              (default: ndjson)",
+        default="ndjson",
+    )
+
+
+def sort_arg(parser):
+    """define arguments to be added"""
+    return parser.add_argument(
+        "--sort",
+        action="store_true",
+        help="Sort and remove the duplicated ip addresses of --batch",
+        default=False,
     )
 
 
@@ -108,6 +157,88 @@ def bgpscan_arg(parser):
     )
 
 
+def parser_arg(parser):
+    """define arguments to be added"""
+    return parser.add_argument(
+        "--parser",
+        metavar="",
+        type=str,
+        choices=["mrtparse", "bgpscanner", "native"],
+        help="Parser of the mrt file [mrtparse|bgpscanner|native](default: mrtparse)",
+        default="mrtparse",
+    )
+
+
+def stream_arg(parser):
+    """define arguments to be added"""
+    return parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Insert mrt entries into the mmdb tree as they are parsed (lower memory)",
+        default=False,
+    )
+
+
+def updates_arg(parser):
+    """define arguments to be added"""
+    return parser.add_argument(
+        "--updates",
+        metavar="",
+        type=str,
+        nargs="*",
+        help="Filenames of mrt BGP4MP update dumps applied to the routes of each\
+              peer of the --base mmdb file (<base>.ribstate) or of the --mrt\
+              RIB dump when given",
+        default=None,
+    )
+
+
+def base_arg(parser):
+    """define arguments to be added"""
+    return parser.add_argument(
+        "--base",
+        metavar="",
+        type=str,
+        help="Filename of the previous target mmdb file whose state\
+              (<base>.ribstate) is updated by --updates (default: the target)",
+        default="",
+    )
+
+
+def workers_arg(parser):
+    """define arguments to be added"""
+    return parser.add_argument(
+        "--workers",
+        metavar="",
+        type=int,
+        help="Number of processes to parse an uncompressed mrt file, to encode\
+              the data section of the mmdb file or to trim the mmdb files of\
+              --mmdbs (default: 1)",
+        default=1,
+    )
+
+
+def no_cache_arg(parser):
+    """define arguments to be added"""
+    return parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Do not use the ASN description cache of the mmdb file (<mmdb>.asncache)\
+              and the parsed mrt snapshot (<mrt>.ribsnap)",
+        default=False,
+    )
+
+
+def asn_index_arg(parser):
+    """define arguments to be added"""
+    return parser.add_argument(
+        "--asn_index",
+        action="store_true",
+        help="Write the ASN->networks index of the target mmdb file (<target>.asnprefix)",
+        default=False,
+    )
+
+
 def display_arg(parser):
     """define arguments to be added"""
     return parser.add_argument(
@@ -127,6 +258,63 @@ def trim_arg(parser):
     )
 
 
+def mmdbs_arg(parser):
+    """define arguments to be added"""
+    return parser.add_argument(
+        "--mmdbs",
+        metavar="",
+        nargs="+",
+        help="Filenames or glob patterns of mmdb files trimmed at once"
+        " (instead of --mmdb)",
+        default=None,
+    )
+
+
+def cache_size_arg(parser):
+    """define arguments to be added"""
+    return parser.add_argument(
+        "--cache_size",
+        metavar="",
+        type=int,
+        help="Maximum number of distinct values kept by the cache of the mmdb\
+              encoder, the least recently used are evicted (default: 0, no limit)",
+        default=0,
+    )
+
+
+def cache_policy_arg(parser):
+    """define arguments to be added"""
+    return parser.add_argument(
+        "--cache_policy",
+        choices=["all", "leaf"],
+        help="Values cached by the mmdb encoder: all of them, or only the\
+              strings, numbers and maps/arrays without nested map/array (default: all)",
+        default="all",
+    )
+
+
+def repack_arg(parser):
+    """define arguments to be added"""
+    return parser.add_argument(
+        "--repack",
+        action="store_true",
+        help="Re-pack the search tree into the smallest record size (24, 28 or 32"
+        " bits) holding the trimmed data section",
+        default=False,
+    )
+
+
+def merge_arg(parser):
+    """define arguments to be added"""
+    return parser.add_argument(
+        "--merge",
+        action="store_true",
+        help="Merge the sibling networks left with the same trimmed data record"
+        " into one network (changes the networks of the lookups)",
+        default=False,
+    )
+
+
 def prometheus_arg(parser):
     """define arguments to be added"""
     return parser.add_argument(
@@ -148,6 +336,28 @@ def database_type_arg(parser):
     )
 
 
+def filter_network_arg(parser):
+    """define arguments to be added"""
+    return parser.add_argument(
+        "--filter_network",
+        metavar="",
+        type=str,
+        help="Only display the networks overlapping these networks (comma separated)",
+        default="",
+    )
+
+
+def filter_asn_arg(parser):
+    """define arguments to be added"""
+    return parser.add_argument(
+        "--filter_asn",
+        metavar="",
+        type=str,
+        help="Only display the networks of these ASN (comma separated)",
+        default="",
+    )
+
+
 def show_db_type_arg(parser):
     """define arguments to be added"""
     return parser.add_argument(
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+This module cache the ASN->Description table made from a Maxmind mmdb file
+into a sorted index next to the mmdb file (<mmdb>.asncache). The cache is
+keyed by the path, size, mtime and build_epoch of the mmdb file, a new mmdb
+file is detected and the table is made again.
+"""
+import os
+import maxminddb
+from sorted_index import SortedIndex, write_index
+
+ASN_CACHE_SUFFIX = ".asncache"
+
+
+class AsnIndex(SortedIndex):
+    """
+    Read only ASN (str) -> Description (str) mapping of a cache file, used in
+    place of the dictionary made by make_asn
+    """
+
+    def __getitem__(self, asn):
+        try:
+            return super().__getitem__(int(asn)).decode()
+        except ValueError as exc:
+            raise KeyError(asn) from exc
+
+    def __contains__(self, asn):
+        try:
+            return super().__contains__(int(asn))
+        except ValueError:
+            return False
+
+    def __iter__(self):
+        return map(str, super().__iter__())
+
+
+def cache_filename(fname):
+    """return the filename of the cache of the mmdb file"""
+    return fname + ASN_CACHE_SUFFIX
+
+
+def source_key(fname):
+    """
+    Input: Filename of the mmdb file
+    Output: dict identifying the mmdb file, the cache is valid while the key is
+            the same
+    """
+    stat = os.stat(fname)
+    with maxminddb.open_database(fname) as mreader:
+        build_epoch = mreader.metadata().build_epoch
+    return {
+        "path": os.path.abspath(fname),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "build_epoch": build_epoch,
+    }
+
+
+def load_asn_cache(fname):
+    """
+    Input: Filename of the mmdb file
+    Output: tuple of the AsnIndex and the count of prefixes the table was made
+            from, None if there is no valid cache for the mmdb file
+    """
+    try:
+        index = AsnIndex(cache_filename(fname))
+    except (OSError, ValueError):
+        return None
+    if index.meta.get("source") != source_key(fname):
+        index.close()
+        return None
+    return index, index.meta.get("count", len(index))
+
+
+def save_asn_cache(fname, asn, count):
+    """
+    Input: Filename of the mmdb file, the ASN->Description dictionary and the
+           count of prefixes the dictionary was made from
+    Output: True if the cache was written
+    """
+    try:
+        write_index(
+            cache_filename(fname),
+            ((int(k), v.encode()) for k, v in asn.items()),
+            {"source": source_key(fname), "count": count},
+        )
+    except (OSError, ValueError, OverflowError):
+        return False
+    return True
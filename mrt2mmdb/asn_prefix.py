@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""
+This module keep a reverse ASN -> networks index of a mmdb file in a sorted
+index next to the mmdb file (<mmdb>.asnprefix). The networks of an ASN are
+found with a binary search of the mmap'd index instead of iterating over the
+whole mmdb file. The index is keyed by the mmdb file like the ASN cache, an
+index out of date is not used. The index is only written on request
+(mrt2mmdb --asn_index), the lookups never write next to the mmdb file.
+"""
+from collections import defaultdict
+import maxminddb
+import maxminddb.reader
+from asn_cache import source_key
+from mmdb_tree import data_networks
+from prefix_table import format_prefix
+from sorted_index import SortedIndex, write_index
+
+ASN_PREFIX_SUFFIX = ".asnprefix"
+
+
+class AsnPrefixIndex(SortedIndex):
+    """
+    Read only ASN (int or str) -> list of networks (str) mapping of an index
+    file, the networks are in the order of the mmdb file
+    """
+
+    def __getitem__(self, asn):
+        try:
+            return super().__getitem__(int(asn)).decode().split("\n")
+        except ValueError as exc:
+            raise KeyError(asn) from exc
+
+    def __contains__(self, asn):
+        try:
+            return super().__contains__(int(asn))
+        except ValueError:
+            return False
+
+    def networks(self, asn):
+        """list of the networks of the ASN, empty if the ASN is not found"""
+        try:
+            return self[asn]
+        except KeyError:
+            return []
+
+
+def index_filename(fname):
+    """return the filename of the ASN->networks index of the mmdb file"""
+    return fname + ASN_PREFIX_SUFFIX
+
+
+def load_asn_prefix(fname):
+    """
+    Input: Filename of the mmdb file
+    Output: AsnPrefixIndex of the mmdb file, None if there is no valid index
+    """
+    try:
+        index = AsnPrefixIndex(index_filename(fname))
+    except (OSError, ValueError):
+        return None
+    if index.meta.get("source") != source_key(fname):
+        index.close()
+        return None
+    return index
+
+
+def save_asn_prefix(fname):
+    """
+    Input: Filename of the mmdb file
+    Output: Number of networks in the index written to <mmdb>.asnprefix
+    Workflow: The search tree is walked once (data_networks) and the networks
+              are grouped by data record, the ASN of each distinct data record
+              is decoded once. Networks without ASN are not indexed.
+    """
+    by_pointer = defaultdict(list)
+    with maxminddb.reader.Reader(fname, maxminddb.MODE_MMAP) as mreader:
+        for network, length, version, pointer in data_networks(mreader):
+            by_pointer[pointer].append((network, length, version))
+        networks = defaultdict(list)
+        for pointer, prefixes in by_pointer.items():
+            # pylint: disable=protected-access
+            data = mreader._resolve_data_pointer(pointer)
+            try:
+                networks[int(data["autonomous_system_number"])].extend(prefixes)
+            except (KeyError, TypeError, ValueError):
+                pass
+    count = 0
+    items = {}
+    for asn, prefixes in networks.items():
+        # back in the order of the mmdb file, ipv4 networks are under ::/96
+        prefixes.sort(key=lambda p: (p[2] == 6, p[0]))
+        items[asn] = "\n".join(format_prefix(*p) for p in prefixes).encode()
+        count += len(prefixes)
+    write_index(
+        index_filename(fname), items, {"source": source_key(fname), "count": count}
+    )
+    return count
+
+
+def open_asn_prefix(fname, build=False):
+    """
+    Input: Filename of the mmdb file, make the index when it is missing or
+           out of date if build is set
+    Output: AsnPrefixIndex of the mmdb file, None if there is no index (or it
+            cannot be written)
+    """
+    index = load_asn_prefix(fname)
+    if index is None and build:
+        try:
+            save_asn_prefix(fname)
+        except (OSError, OverflowError):
+            return None
+        index = load_asn_prefix(fname)
+    return index
+
+
+def lookup_asns(fname, asns, reader=None, build=False):
+    """
+    Input: Filename of the mmdb file, iterable of ASN, an opened reader of the
+           mmdb file (optional), make the index when it is missing or out of
+           date if build is set
+    Output: dict of ASN -> list of (network, data) of the ASN. All the ASN are
+            looked up with one index and one reader, without a valid index
+            (or when it cannot be written) the mmdb file is scanned once for
+            all the ASN
+    """
+    index = open_asn_prefix(fname, build)
+    owned = reader is None
+    if owned:
+        reader = maxminddb.open_database(fname, maxminddb.MODE_AUTO)
+    try:
+        if index is None:
+            return scan_asns(reader, asns)
+        result = {}
+        for asn in asns:
+            result[asn] = [
+                (prefix, reader.get(prefix.split("/")[0]))
+                for prefix in index.networks(asn)
+            ]
+        return result
+    finally:
+        if index is not None:
+            index.close()
+        if owned:
+            reader.close()
+
+
+def scan_asns(reader, asns):
+    """
+    Input: opened reader of the mmdb file, iterable of ASN
+    Output: same as lookup_asns, iterating over all the networks of the reader
+    """
+    result = {asn: [] for asn in asns}
+    wanted = {str(asn): asn for asn in result}
+    for prefix, data in reader:
+        try:
+            asn = wanted.get(str(data["autonomous_system_number"]))
+        except (KeyError, TypeError):
+            continue
+        if asn is not None:
+            result[asn].append((prefix.compressed, data))
+    return result
+
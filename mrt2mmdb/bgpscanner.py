@@ -18,13 +18,13 @@ def sanitize(text):
     return text
 
 
-def parse_bgpscanner(fname, pb, result, num_prefix):
+def iter_bgpscanner(fname, num_prefix):
     """
     For future optimization and improvement using bgpscanner external
     process to speed up the mrt loading process
         ['/usr/bin/env','LD_LIBRARY_PATH="./lib"','bin/bgpscanner', fname],
+    Generator of (prefix, AS_PATH) of each line of the bgpscanner output
     """
-    count = 0
     my_env = os.environ.copy()
     exec_path = os.path.dirname(os.path.abspath(__file__))
     my_env["LD_LIBRARY_PATH"] = exec_path + "/lib"
@@ -37,13 +37,18 @@ def parse_bgpscanner(fname, pb, result, num_prefix):
         universal_newlines=True,
     ) as process:
         for line in itertools.islice(process.stdout, num_prefix):
-            pb.update(1)
-            count += 1
             val = line.split("|")
-            prefix = val[1]
-            aspath = sanitize(val[2])
-            result[prefix] = [aspath.split(), prefix]
+            yield val[1], sanitize(val[2]).split()
             sys.stdout.flush()
+
+
+def parse_bgpscanner(fname, pb, result, num_prefix):
+    """Parsing of the mrt file using bgpscanner into the result PrefixTable"""
+    count = 0
+    for prefix, aspath in iter_bgpscanner(fname, num_prefix):
+        pb.update(1)
+        count += 1
+        result[prefix] = aspath
     return result, count
 
 
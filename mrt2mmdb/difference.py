@@ -5,7 +5,6 @@ Show the differences in different object files eg. Maxmind mmdb vs custom lookup
 import sys
 import logging
 import json
-from deepdiff import DeepDiff
 
 from make_mmdb import (
     make_asn_custom,
@@ -23,27 +22,62 @@ from args import (
     log_level_arg,
 )
 
+# number of changes written to the output at once
+WRITE_BATCH = 4096
 
-# pylint: disable=global-statement
-def compare(dict0, dict1, args, logger):
-    """Compare two dictionaries then print out the statistics
-    if --print_changes is set, output the changes in json format
+
+def diff_tables(table0, table1):
     """
-    if args.quiet:
-        freq = 0
-    else:
-        freq = 1
-    diff = DeepDiff(
-        dict0,
-        dict1,
-        log_frequency_in_sec=freq,
-        progress_logger=logger.warning,
-    )
-    for i in (delta := list(diff)):
-        logger.warning(f"{i} = {len(diff[i])}")
-    if args.print_changes and "values_changed" in delta:
-        logger.warning(json.dumps(diff["values_changed"], indent=1))
-    return diff
+    Input: Two flat key->value mappings
+    Output: generator of (change, key, old value, new value), change is
+            "removed" (key only in table0), "changed" (value differ) or "added"
+            (key only in table1). The keys of table0 are in its order, followed
+            by the added keys in the order of table1.
+    Workflow: One pass over each table with hash lookups of the other one, the
+              values are compared with == and nothing is copied.
+    """
+    missing = object()
+    for key, old in table0.items():
+        new = table1.get(key, missing)
+        if new is missing:
+            yield "removed", key, old, None
+        elif new != old:
+            yield "changed", key, old, new
+    for key, new in table1.items():
+        if key not in table0:
+            yield "added", key, None, new
+
+
+def ndjson_line(change, key, old, new):
+    """one json object per line: {"change": , "key": , "old": , "new": }"""
+    return json.dumps({"change": change, "key": key, "old": old, "new": new}) + "\n"
+
+
+def compare(dict0, dict1, args, logger, outfile=None):
+    """
+    Input: Two flat key->value tables, the arguments, the logger and the file
+           object of the changes (default: stdout)
+    Output: dict of the number of changes by type (added, removed, changed)
+    Workflow: The changes of diff_tables are counted and, if --print_changes
+              is set, written as NDJSON in batches of WRITE_BATCH lines while
+              they are found. The counts are logged at the end (stderr
+              with --print_changes, see main).
+    """
+    outfile = outfile or sys.stdout
+    counts = {"added": 0, "removed": 0, "changed": 0}
+    batch = []
+    for change in diff_tables(dict0, dict1):
+        counts[change[0]] += 1
+        if args.print_changes:
+            batch.append(ndjson_line(*change))
+            if len(batch) >= WRITE_BATCH:
+                outfile.write("".join(batch))
+                batch.clear()
+    outfile.write("".join(batch))
+    outfile.flush()
+    for change, count in counts.items():
+        logger.warning(f"{change} = {count}")
+    return counts
 
 
 def main():
@@ -63,10 +97,10 @@ def main():
     )
     args = parser.parse_args()
 
-    # set up basic logging
+    # set up basic logging, stdout is kept for the NDJSON of --print_changes
     logging_level = getattr(logging, (args.log_level).upper(), None)
     logging.basicConfig(
-        stream=sys.stdout,
+        stream=sys.stderr if args.print_changes else sys.stdout,
         level=logging_level,
         format="",
         force=True,
@@ -74,17 +108,16 @@ def main():
     logger = logging.getLogger(__name__)
     logger.debug(args)
 
-    # Turn off progress report in quiet mode
-    # Frequency of 0 sec is to supress progress report
-
     if args.compare_routing is not None and len(args.compare_routing) == 2:
         routing0, _ = make_routing(args.compare_routing[0], args.quiet)
         routing1, _ = make_routing(args.compare_routing[1], args.quiet)
         compare(routing0, routing1, args, logger)
 
     if args.compare_asn and args.lookup_file != "" and args.mmdb != "":
-        asn0, _ = make_asn(args.mmdb, args.quiet)
-        asn1, _ = make_asn_custom(args.lookup_file, args.quiet)
+        asn0, _ = make_asn(args.mmdb, logger, args.quiet)
+        asn1, _ = make_asn_custom(args.lookup_file, logger, args.quiet)
+        # the cached asn table is a read only mapping
+        asn0 = dict(asn0)
         compare(asn0, asn1, args, logger)
     return 0
 
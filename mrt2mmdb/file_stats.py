@@ -23,11 +23,21 @@ def all_files_create(files, logger):
     return [file_create(f, logger) for f in files]
 
 
-def arguments_filename(parser, logger):
+def arguments_filename(parser, logger, state_suffix=""):
     """Sanitize the filename obtain from the arguments,exit and print
-    help menu if the file does not exist"""
+    help menu if the file does not exist. state_suffix is the suffix of the
+    file saved next to the target by --updates"""
     args = parser.parse_args()
-    if not os.path.isfile(args.mrt):
+    if getattr(args, "updates", None):
+        args.base = args.base or args.target
+        # the updates start from the RIB dump given with --mrt, else from the
+        # state of the previous target
+        args.rib = args.mrt if args.mrt != parser.get_default("mrt") else None
+        for fname in [args.rib or args.base + state_suffix] + args.updates:
+            if not os.path.isfile(fname):
+                logger.warning(f"\nerror: unable to locate {fname}\n")
+                file_error(parser)
+    elif not os.path.isfile(args.mrt):
         logger.warning("\nerror: unable to locate mrt file\n")
         file_error(parser)
     if not os.path.isfile(args.mmdb) and not args.custom_lookup_only:
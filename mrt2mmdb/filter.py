@@ -2,60 +2,59 @@
 """
 utility to help lookup on description of network base on IP address or ASN
 """
+import glob
 import os
 import sys
-import ipaddress
-import struct
-import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import repeat
 from tqdm import tqdm
 import maxminddb
+from maxminddb.decoder import Decoder
 from maxminddb.reader import Reader
-from mmdb_encoder import Encoder
+from mmdb_encoder import Encoder, METADATA_MAGIC, ShardEncoder, pointer_value
+from mmdb_tree import (
+    DATA_SECTION_SEPARATOR_SIZE,
+    TreeBuilder,
+    leaf_records,
+    merge_nodes,
+    pack_nodes,
+)
 
 from args import (
     get_args,
     mmdb_arg,
+    mmdbs_arg,
     trim_arg,
+    repack_arg,
+    merge_arg,
+    workers_arg,
+    cache_size_arg,
+    cache_policy_arg,
     quiet_arg,
 )
 
 
-# pylint: disable=global-statement
-args = {}
-
-
 def decode_pointer(res, reader):
     """
-    This function will decode the data section pointer and return a data offset
-    for used in the leaf node. The return needs to be 4 bytes as we are dealing with
-    a 32 bites nodes
-    """
-    if len(res) == 5:
-        _, pointer = struct.unpack(">BI", res)
-    elif len(res) == 4:
-        b0, b1, b2, b3 = struct.unpack(">BBBB", res)
-        pointer = (b0 & 0x07) << 24 | b1 << 16 | b2 << 8 | b3
-        pointer += 526336
-    elif len(res) == 3:
-        b0, b1, b2 =  struct.unpack(">BBB", res)
-        pointer = (b0 & 0x07) << 16 | b1 << 8 | b2
-        pointer += 2048
-    elif len(res) == 2:
-        b0, b1 = struct.unpack(">BB", res)
-        pointer = (b0 & 0x07) << 8 | b1
-    else:
-        raise ValueError("Invalid encoded pointer")
-    return struct.pack(">I", pointer + reader._metadata.node_count + 16)
+    This function will decode the data section pointer returned by the encoder
+    and return the value of the leaf record pointing to the data (the data
+    offset + node count + 16), packed later with the record size of the tree
+    """
+    return (
+        pointer_value(res) + reader._metadata.node_count + DATA_SECTION_SEPARATOR_SIZE
+    )
+
 
-def filter_dict(raw):
+def filter_dict(raw, trim=None):
     """
     filter and remove keys from dictionary. The keys to be removed are store in ignore_keys and ignore_lang
-    list
+    list, and the keys given by trim (--trim)
     """
     ignore_keys = []
     ignore_lang = ["de", "es", "fr", "ja", "pt-BR", "ru", "zh-CN"]
-    if args.trim:
-        rem_keys = ignore_keys + ignore_lang + args.trim
+    if trim:
+        rem_keys = ignore_keys + ignore_lang + trim
     else:
         rem_keys = ignore_keys + ignore_lang
 
@@ -75,72 +74,326 @@ def filter_dict(raw):
     return fnc(raw)
 
 
-def load_db(fname):
+def load_db(reader, trim=None):
+    """
+    Input: maxminddb.reader.Reader (pure python reader) of the mmdb file and
+           the keys to be removed (--trim)
+    Output: Tuple of the records of the search tree, the list of the index of
+            the leaf records and the generator of the (data pointer, filtered
+            dictionary) of each distinct data record. A data record shared by
+            many networks is decoded and filtered once, in the order of its
+            first network in the search tree.
+    """
+    records, leaves = leaf_records(reader)
+    leaves = list(leaves)
+    # pylint: disable=protected-access
+    res = (
+        (pointer, filter_dict(reader._resolve_data_pointer(pointer), trim))
+        for pointer in dict.fromkeys(map(records.__getitem__, leaves))
+    )
+    return records, leaves, res
+
+
+def filter_shard(fname, pointers, trim=None):
+    """
+    Input: Filename of the mmdb file, a slice of the data pointers and the
+           keys to be removed (--trim)
+    Output: shard (ShardEncoder.shard) of the filtered data records, decoded,
+            filtered and encoded in a worker process
+    """
+    shard = ShardEncoder()
+    with Reader(fname, maxminddb.MODE_MMAP) as reader:
+        # pylint: disable=protected-access
+        roots = [
+            shard.encode(filter_dict(reader._resolve_data_pointer(pointer), trim))
+            for pointer in pointers
+        ]
+    return shard.shard(roots)
+
+
+def encode_shards(fname, pointers, trim, encoder, count, workers):
     """
-    Load mmdb file and use it to create a generator expression to
-    avoid loading the entire structure into the memory. This function 
-    will return a list of prefix/dictionaries generator expression
+    Input: Filename of the mmdb file, the distinct data pointers, the keys to
+           be removed, the Encoder, the progress bar and the number of
+           processes
+    Output: list of the pointers returned by the encoder for each data pointer
+    Workflow: The data pointers are split into consecutive slices filtered
+              and encoded by a pool of worker processes (filter_shard), the
+              shards are merged in order into the data section of the
+              encoder (Encoder.shardable), giving the same data section and
+              cache statistics as the serial encoding.
     """
-    result = []
-    mreader = maxminddb.open_database(fname)
-    res = (((prefix.compressed), filter_dict(data)) for prefix, data in mreader)
-    mreader.close
+    size = -(-len(pointers) // (workers * 4))
+    slices = [pointers[i : i + size] for i in range(0, len(pointers), size)]
+    res = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        shards = executor.map(filter_shard, repeat(fname), slices, repeat(trim))
+        for part, shard in zip(slices, shards):
+            res += encoder.merge_shard(*shard)
+            count.update(len(part))
     return res
 
 
-def rewrite(fname, dic_data, count):
-    shutil.copyfile(fname, fname + ".trim")
-    with open(fname + ".trim", "r+b") as fh:
-        with Reader(fname) as reader:
-            metadata = reader.metadata()
-            treesize = int(((metadata.record_size * 2) / 8) * metadata.node_count)
-            data_section_start = treesize + 16
-            data_section_end = reader._buffer.rfind(
-                reader._METADATA_START_MARKER, max(0, reader._buffer_size - 128 * 1024)
+def rewrite_metadata(reader, metadata_start, node_count, record_size):
+    """
+    Input: maxminddb.reader.Reader of the mmdb file, offset of the metadata
+           marker, the new node count and record size
+    Output: bytes of the metadata (with the marker) with the node count and
+            record size replaced, the other keys are kept as is
+    """
+    # pylint: disable=protected-access
+    start = metadata_start + len(METADATA_MAGIC)
+    meta, _ = Decoder(reader._buffer, start).decode(start)
+    meta["node_count"] = node_count
+    meta["record_size"] = record_size
+    return METADATA_MAGIC + Encoder(cache=False).encode_meta(meta)
+
+
+def rewrite(
+    fname,
+    count,
+    repack=False,
+    trim=None,
+    merge=False,
+    cache_size=0,
+    cache_policy="all",
+    workers=1,
+):
+    """
+    Input: Filename of the mmdb file, the progress bar, whether the search
+           tree is re-packed into the smallest record size, the keys to be
+           removed (--trim), whether the sibling networks are merged
+           (--merge), the size and policy of the encoder cache and the
+           number of processes encoding the data records
+    Output: cache statistics of the encoder (Encoder.cache_stats). The
+            trimmed mmdb file is written to <mmdb>.trim
+    Workflow: Each distinct data record is filtered and encoded once into a
+              new data section (Encoder with cache, repeated data is
+              referenced by pointers), giving a table of old -> new data
+              pointers. The records are encoded in the order of their first
+              network, the data section only holds the records reachable
+              from the search tree. With workers > 1 and the unbounded cache
+              of policy all, the records are filtered and encoded in a pool
+              of processes (encode_shards). The leaf records of the unpacked
+              search tree (24, 28 or 32 bits records) are remapped through
+              this table, then the sibling records pointing to the same trimmed
+              record are merged (merge_nodes) if merge is set. The search
+              tree is packed again with the record size of the mmdb file, or
+              the smallest record size holding the new data section if
+              repack is set (the node_count and record_size of the metadata
+              are updated). The search tree, the data section and the
+              metadata are written at once.
+    """
+    with Reader(fname, maxminddb.MODE_MMAP) as reader:
+        metadata = reader.metadata()
+        data_section_end = reader._buffer.rfind(
+            reader._METADATA_START_MARKER, max(0, reader._buffer_size - 128 * 1024)
+        )
+        encode_record = Encoder(
+            cache=True, cache_size=cache_size, cache_policy=cache_policy
+        )
+        records, leaves, dic_data = load_db(reader, trim)
+        new_pointer = {}
+        if workers > 1 and encode_record.shardable:
+            pointers = list(dict.fromkeys(map(records.__getitem__, leaves)))
+            encoded = encode_shards(
+                fname, pointers, trim, encode_record, count, workers
             )
-    
-            resolved = data_section_start
+            for pointer, res in zip(pointers, encoded):
+                new_pointer[pointer] = decode_pointer(res, reader)
+            dic_data = ()
+        for pointer, record in dic_data:
+            """
+            Encode the dictionary record using the Encode Record Object. Cache is set to
+            True. This ensure that repeated data (strings, float, integers) are referenced
+            by pointers instead of re-encoding the same data. This save bytes. The return
+            (data pointer) from the Encode Record Object is the new pointer of the leaf
+            records pointing to the old record.
+            """
+            new_pointer[pointer] = decode_pointer(encode_record.encode(record), reader)
+            count.update(1)
+        for leaf in leaves:
+            records[leaf] = new_pointer[records[leaf]]
+        node_count = metadata.node_count
+        if merge:
+            records, node_count = merge_nodes(records, node_count)
+        record_size = TreeBuilder.record_size(
+            node_count
+            + DATA_SECTION_SEPARATOR_SIZE
+            + encode_record.data_pointer
+        )
+        if not repack:
+            # keep the record size unless the new data section does not fit
+            record_size = max(record_size, metadata.record_size)
+        if (node_count, record_size) == (metadata.node_count, metadata.record_size):
             metadata_cache = reader._buffer[data_section_end:]
-            encode_record = Encoder(cache=True)
-            for prefix, record in dic_data:
-                a = prefix.split("/")[0]
-                address = bytearray(ipaddress.ip_address(a).packed)
-                """
-                Encode the dictionary record using the Encode Record Object. Cache is set to
-                True. This ensure that repeated data (strings, float, integers) are referenced 
-                by pointers instead of re-encoding the same data. This save bytes. We also
-                Use the return (data pointer) from the Encode Record Object, for locating the
-                relevent search tree node. We can update the leaf node pointer to this new encoded
-                data as the data had changed.
-                """
-                pack = encode_record.encode(record)
-                pack_pointer = decode_pointer(pack, reader)
-                """
-                Update the search tree leaf node with the pointer of the data for this node
-                using the custom find_address_in_tree_loc function from Decoder module. The 
-                function return -> the address of the location of leaf node. 
-                Result :      Tuple of location of leaf node (loc) and the pointer 
-                              (data_pointer) to the data. 
-                """
-                ((_, loc), _) = reader._find_address_in_tree_loc(
-                    address
+        else:
+            metadata_cache = rewrite_metadata(
+                reader, data_section_end, node_count, record_size
+            )
+    with open(fname + ".trim", "wb") as fh:
+        fh.write(pack_nodes(records, record_size))
+        fh.write(b"\x00" * DATA_SECTION_SEPARATOR_SIZE)
+        fh.write(encode_record.data)
+        fh.write(metadata_cache)
+    return encode_record.cache_stats()
+
+
+def trim_file(
+    fname,
+    trim=None,
+    repack=False,
+    merge=False,
+    quiet=False,
+    position=None,
+    cache_size=0,
+    cache_policy="all",
+    workers=1,
+):
+    """
+    Input: Filename of the mmdb file, the keys to be removed (--trim), whether
+           the search tree is re-packed (--repack), whether the sibling
+           networks are merged (--merge), verbose, the position of
+           the progress bar (one line per file trimmed at once), the size and
+           policy of the encoder cache and the number of processes encoding
+           the data records
+    Output: Tuple of the filename, the number of distinct data records, the
+            size of the mmdb file and of the trimmed file, the time taken and
+            the cache statistics of the encoder
+    """
+    start = time.perf_counter()
+    with tqdm(
+        desc=f" {'Apply filter to trim ' + os.path.basename(fname): <80}  ",
+        unit=" records",
+        disable=quiet,
+        position=position,
+    ) as pb:
+        stats = rewrite(
+            fname, pb, repack, trim, merge, cache_size, cache_policy, workers
+        )
+        records = pb.n
+    return (
+        fname,
+        records,
+        os.path.getsize(fname),
+        os.path.getsize(fname + ".trim"),
+        time.perf_counter() - start,
+        stats,
+    )
+
+
+def expand_mmdb(patterns):
+    """
+    Input: list of filenames or glob patterns of mmdb files
+    Output: list of the mmdb files, without duplicates and without the trimmed
+            files (<mmdb>.trim) matched by a pattern. The filenames given
+            without pattern are kept even if they are missing, their error is
+            reported by trim_files.
+    """
+    files = []
+    for pattern in patterns:
+        if not glob.has_magic(pattern):
+            files.append(pattern)
+            continue
+        matches = sorted(glob.glob(pattern))
+        files += [f for f in matches if os.path.isfile(f) and not f.endswith(".trim")]
+    return list(dict.fromkeys(files))
+
+
+def trim_files(
+    files,
+    trim=None,
+    repack=False,
+    merge=False,
+    quiet=False,
+    workers=1,
+    cache_size=0,
+    cache_policy="all",
+):
+    """
+    Input: list of the mmdb files, the keys to be removed, whether the search
+           trees are re-packed, whether the sibling networks are merged,
+           verbose, the number of processes, the size and policy of the
+           encoder cache
+    Output: Tuple of the list of trim_file results in the order of the files
+            and the dict of filename -> error of the files not trimmed
+    Workflow: The files are trimmed by a pool of worker processes, the largest
+              files first so that the job takes about the time of the largest
+              file. A single file is trimmed with its data records encoded by
+              the pool of worker processes instead. A file that cannot be
+              trimmed does not stop the others.
+    """
+    if workers <= 1 or len(files) <= 1:
+        results = {}
+        errors = {}
+        for fname in files:
+            try:
+                results[fname] = trim_file(
+                    fname,
+                    trim,
+                    repack,
+                    merge,
+                    quiet,
+                    None,
+                    cache_size,
+                    cache_policy,
+                    workers,
                 )
-                fh.seek(loc)
-                fh.write(pack_pointer)
-                """
-                extract the data content from the Encoded Record Object. Once extract the required data
-                zero out the data list. This is to ensure the Encoded Record Object remain lean. However,
-                we need to ensure this data is written to the mmdb file.
-                """
-                encode_data = encode_record.data_list
-                data_bytes = b"".join([bytes_obj for bytes_obj in encode_data])
-                fh.seek(resolved)
-                fh.write(data_bytes)
-                resolved += len(data_bytes)
-                encode_record.data_list = []
-                count.update(1)
-            fh.write(metadata_cache)
-            fh.truncate(fh.tell())
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                errors[fname] = exc
+        return [results[f] for f in files if f in results], errors
+    order = sorted(
+        files,
+        key=lambda f: os.path.getsize(f) if os.path.isfile(f) else 0,
+        reverse=True,
+    )
+    results = {}
+    errors = {}
+    with ProcessPoolExecutor(max_workers=min(workers, len(files))) as executor:
+        futures = {
+            executor.submit(
+                trim_file,
+                fname,
+                trim,
+                repack,
+                merge,
+                quiet,
+                position,
+                cache_size,
+                cache_policy,
+            ): fname
+            for position, fname in enumerate(order)
+        }
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                errors[futures[future]] = exc
+    return [results[f] for f in files if f in results], errors
+
+
+def print_summary(results, elapsed):
+    """
+    print the size saved, the records/s and the encoder cache hit rate of each
+    trimmed file and the total
+    """
+    total_records = total_size = total_trim = 0
+    for fname, records, size, trim_size, seconds, stats in results:
+        print(
+            f"{fname}: {size} -> {trim_size} bytes ({size - trim_size} saved),"
+            f" {records} records in {seconds:.2f}s"
+            f" ({records / max(seconds, 1e-9):.0f} records/s),"
+            f" cache hit rate {stats['hit_rate']:.1%}"
+            f" ({stats['bytes_saved']} bytes deduplicated)"
+        )
+        total_records += records
+        total_size += size
+        total_trim += trim_size
+    print(
+        f"{len(results)} files: {total_size} -> {total_trim} bytes"
+        f" ({total_size - total_trim} saved), {total_records} records in"
+        f" {elapsed:.2f}s ({total_records / max(elapsed, 1e-9):.0f} records/s)"
+    )
 
 
 def main():
@@ -148,22 +401,44 @@ def main():
     main function for the workflow
     """
     parser = get_args(
-        [mmdb_arg,trim_arg,quiet_arg]
+        [
+            mmdb_arg,
+            mmdbs_arg,
+            trim_arg,
+            repack_arg,
+            merge_arg,
+            workers_arg,
+            cache_size_arg,
+            cache_policy_arg,
+            quiet_arg,
+        ]
     )
-    global args
     args = parser.parse_args()
-    if not os.path.isfile(args.mmdb):
+    if not args.mmdbs and not os.path.isfile(args.mmdb):
+        parser.print_help(sys.stderr)
+        sys.exit(1)
+    files = expand_mmdb(args.mmdbs if args.mmdbs else [args.mmdb])
+    if not files:
         parser.print_help(sys.stderr)
         sys.exit(1)
+    start = time.perf_counter()
+    results, errors = trim_files(
+        files,
+        args.trim,
+        args.repack,
+        args.merge,
+        args.quiet,
+        args.workers,
+        args.cache_size,
+        args.cache_policy,
+    )
+    for fname, exc in errors.items():
+        print(f"{fname}: {exc}", file=sys.stderr)
+    if args.mmdbs and not args.quiet:
+        print_summary(results, time.perf_counter() - start)
+    if errors:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
     main()
-    fname = args.mmdb
-    with tqdm(
-             desc=f" {'Apply filter to trim mmdb file': <80}  ",
-            unit=" prefixes",
-            disable=args.quiet
-        ) as pb:
-        db = load_db(fname)
-        rewrite(fname, db, pb)
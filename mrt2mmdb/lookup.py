@@ -14,7 +14,17 @@ from args import (
     asn_arg,
     display_arg,
     show_db_type_arg,
+    serve_arg,
+    batch_arg,
+    output_format_arg,
+    sort_arg,
+    filter_network_arg,
+    filter_asn_arg,
 )
+from lookup_server import serve
+from lookup_batch import WRITERS, batch_lookup, open_input
+from asn_prefix import lookup_asns
+from lookup_export import export_db, iter_db
 
 # pylint: disable=global-statement
 args = {}
@@ -30,33 +40,18 @@ def lookup(fname, ipadd):
 
 def lookup_asn(fname, asn):
     """
-    lookup base on ASN. The description is returned.
+    lookup base on ASN. The description of each network of the ASN is returned.
+    The networks are found in the ASN->networks index of the mmdb file
+    (<mmdb>.asnprefix) if it is up to date, else by iterating over the file.
     """
-    result = []
-    with maxminddb.open_database(fname) as mreader:
-        for prefix, data in mreader:
-            try:
-                del prefix
-                if str(data["autonomous_system_number"]) == asn:
-                    result.append(data)
-            except KeyError:
-                print("ASN not found")
-                result = {}
-    return result
+    return [data for _, data in lookup_asns(fname, [asn])[asn]]
 
 
 def show_db(fname):
     """
     display and print the entire mmdb
     """
-    result = []
-    with maxminddb.open_database(fname) as mreader:
-        for prefix, data in mreader:
-            try:
-                result.append((prefix.compressed, data))
-            except KeyError as e:
-                print(f"Error {e}")
-    return result
+    return list(iter_db(fname))
 
 
 def db_type(fname):
@@ -71,7 +66,21 @@ def main():
     """
     main function for the workflow
     """
-    parser = get_args([mmdb_arg, ipaddress_arg, asn_arg, display_arg, show_db_type_arg])
+    parser = get_args(
+        [
+            mmdb_arg,
+            ipaddress_arg,
+            asn_arg,
+            display_arg,
+            show_db_type_arg,
+            serve_arg,
+            batch_arg,
+            output_format_arg,
+            sort_arg,
+            filter_network_arg,
+            filter_asn_arg,
+        ]
+    )
     global args
     args = parser.parse_args()
     if not os.path.isfile(args.mmdb):
@@ -81,11 +90,30 @@ def main():
     if args.ipaddress != "":
         print(json.dumps(lookup(args.mmdb, args.ipaddress), indent=1))
     if args.asn != "":
-        print(json.dumps(lookup_asn(args.mmdb, args.asn), indent=1))
+        # ASN -> list of [network, data] for one or many ASN
+        asns = args.asn.split(",")
+        result = lookup_asns(args.mmdb, asns)
+        print(json.dumps({asn: result[asn] for asn in asns}, indent=1))
     if args.display:
-        print(json.dumps(show_db(args.mmdb), indent=1))
+        export_db(
+            args.mmdb,
+            sys.stdout,
+            args.format,
+            args.filter_network.split(",") if args.filter_network else None,
+            args.filter_asn.split(",") if args.filter_asn else None,
+        )
     if args.show_db_type:
         print(json.dumps(db_type(args.mmdb), indent=1))
+    if args.batch != "":
+        if args.format not in WRITERS:
+            parser.error(f"--format {args.format} is not supported by --batch")
+        with open_input(args.batch) as infile:
+            batch_lookup(args.mmdb, infile, sys.stdout, args.format, args.sort)
+    if args.serve != "":
+        try:
+            serve(args.mmdb, args.serve)
+        except (OSError, ValueError) as exc:
+            parser.error(f"--serve {args.serve}: {exc}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+"""
+This module lookup a stream of ip addresses (one per line, from a file or
+stdin) against a single open mmdb reader and write one NDJSON or CSV line
+per address. The networks resolved recently are kept in a LRU cache with
+their encoded data, the addresses of flow logs are mostly in a few busy
+networks and are answered from the cache without a lookup nor encoding.
+"""
+import csv
+import json
+import socket
+import sys
+from collections import OrderedDict
+import maxminddb
+
+FAMILY = {4: socket.AF_INET, 6: socket.AF_INET6}
+BITS = {4: 32, 6: 128}
+# data fields of the csv output, the records made by make_mmdb
+CSV_FIELDS = (
+    "autonomous_system_number",
+    "autonomous_system_organization",
+    "prefix",
+    "path",
+)
+CACHE_SIZE = 4096
+
+
+def parse_address(address):
+    """
+    Input: ip address string
+    Output: tuple of ip version and address (int). Raise ValueError if the
+            address is invalid
+    """
+    version = 6 if ":" in address else 4
+    try:
+        packed = socket.inet_pton(FAMILY[version], address)
+    except OSError as e:
+        raise ValueError(f"{address!r} does not appear to be an IP address") from e
+    return version, int.from_bytes(packed, "big")
+
+
+class PrefixCache:
+    """
+    LRU cache of the networks resolved by the reader. An address is searched
+    in the cache by masking it with each of the prefix lengths cached, the
+    networks of a mmdb file do not overlap so the first match is the network
+    the reader would return.
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self._networks = OrderedDict()
+        # prefix length -> number of cached networks of this length
+        self._lengths = {4: {}, 6: {}}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version, address):
+        """return the cached value of the network of the address or None"""
+        bits = BITS[version]
+        for length in self._lengths[version]:
+            key = (version, address >> (bits - length), length)
+            value = self._networks.get(key)
+            if value is not None:
+                self._networks.move_to_end(key)
+                self.hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, version, address, length, value):
+        """cache the value of the network address/length"""
+        if self.size <= 0:
+            return
+        key = (version, address >> (BITS[version] - length), length)
+        lengths = self._lengths[version]
+        if key not in self._networks:
+            lengths[length] = lengths.get(length, 0) + 1
+        self._networks[key] = value
+        if len(self._networks) > self.size:
+            (version, _, length), _ = self._networks.popitem(last=False)
+            lengths = self._lengths[version]
+            lengths[length] -= 1
+            if not lengths[length]:
+                del lengths[length]
+
+
+def read_addresses(infile, sort=False):
+    """
+    Input: file object with one ip address per line, sort the addresses and
+           remove the duplicates when sort is set
+    Output: generator of the ip addresses
+    """
+    addresses = (line.strip() for line in infile)
+    addresses = (a for a in addresses if a and not a.startswith("#"))
+    if not sort:
+        yield from addresses
+        return
+
+    def sort_key(address):
+        try:
+            return parse_address(address)
+        except ValueError:
+            return (0, 0)
+
+    yield from sorted(set(addresses), key=sort_key)
+
+
+def resolve(reader, address, version, ipint):
+    """
+    Lookup the address with the reader.
+    Output: tuple of the network string, prefix length and data (None when the
+            address is not in the database)
+    """
+    data, length = reader.get_with_prefix_len(address)
+    bits = BITS[version]
+    network = ipint >> (bits - length) << (bits - length)
+    network = socket.inet_ntop(FAMILY[version], network.to_bytes(bits // 8, "big"))
+    return f"{network}/{length}", length, data
+
+
+class NdjsonWriter:
+    """one json object per line: {"ip": , "network": , "data": }"""
+
+    def __init__(self, outfile):
+        self.outfile = outfile
+
+    @staticmethod
+    def encode(network, data):
+        """encoded part of the line shared by all the addresses of network"""
+        return f'"network": {json.dumps(network)}, "data": {json.dumps(data)}}}\n'
+
+    def write(self, address, encoded):
+        """write the line of the address"""
+        self.outfile.write(f'{{"ip": {json.dumps(address)}, {encoded}')
+
+    def error(self, address, message):
+        """write the error of the address"""
+        self.outfile.write(json.dumps({"ip": address, "error": message}) + "\n")
+
+
+class CsvWriter:
+    """ip, network, CSV_FIELDS, error columns"""
+
+    def __init__(self, outfile):
+        self.writer = csv.writer(outfile, lineterminator="\n")
+        self.writer.writerow(("ip", "network") + CSV_FIELDS + ("error",))
+
+    @staticmethod
+    def encode(network, data):
+        """encoded part of the row shared by all the addresses of network"""
+        data = data if isinstance(data, dict) else {}
+        values = [data.get(field, "") for field in CSV_FIELDS]
+        values = [json.dumps(v) if isinstance(v, (dict, list)) else v for v in values]
+        return [network] + values + [""]
+
+    def write(self, address, encoded):
+        """write the row of the address"""
+        self.writer.writerow([address] + encoded)
+
+    def error(self, address, message):
+        """write the error of the address"""
+        self.writer.writerow([address, ""] + [""] * len(CSV_FIELDS) + [message])
+
+
+WRITERS = {"ndjson": NdjsonWriter, "csv": CsvWriter}
+
+
+def batch_lookup(
+    fname, infile, outfile, output_format="ndjson", sort=False, cache_size=CACHE_SIZE
+):
+    """
+    Input: Filename of the mmdb file, file object of the ip addresses (one per
+           line), file object of the output, output format (ndjson or csv),
+           sort and deduplicate the addresses, size of the network cache
+    Output: tuple of the number of addresses and the PrefixCache
+    Workflow: The mmdb file is opened once. Each address is searched in the
+              cache of the networks resolved before, a miss is looked up by
+              the reader and the encoded network/data is cached.
+    """
+    writer = WRITERS[output_format](outfile)
+    cache = PrefixCache(cache_size)
+    count = 0
+    with maxminddb.open_database(fname, maxminddb.MODE_AUTO) as reader:
+        for address in read_addresses(infile, sort):
+            count += 1
+            try:
+                version, ipint = parse_address(address)
+            except ValueError as e:
+                writer.error(address, str(e))
+                continue
+            encoded = cache.get(version, ipint)
+            if encoded is None:
+                network, length, data = resolve(reader, address, version, ipint)
+                encoded = writer.encode(network if data is not None else None, data)
+                cache.put(version, ipint, length, encoded)
+            writer.write(address, encoded)
+    return count, cache
+
+
+def open_input(fname):
+    """return stdin for - or the opened file"""
+    if fname == "-":
+        return sys.stdin
+    return open(fname, encoding="utf-8")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+"""
+This module export the networks of a mmdb file one by one to a file object as
+NDJSON, a JSON array or CSV, nothing but the search tree is kept in memory.
+The networks can be filtered by network range and by ASN. A data record is
+decoded and encoded once while it is in a LRU cache, the networks of a same
+record (eg. the more specific prefixes splitting a network) are only written.
+"""
+import csv
+import io
+import json
+from functools import lru_cache
+import maxminddb
+import maxminddb.reader
+from lookup_batch import CSV_FIELDS
+from mmdb_tree import data_networks
+from prefix_table import BITS, format_prefix, parse_prefix
+
+# number of encoded data records kept
+CACHE_SIZE = 65536
+# number of lines written to the file object at once
+WRITE_BATCH = 4096
+
+
+def overlaps(network, length, version, ranges):
+    """
+    Input: network (int), prefix length and ip version of a network, list of
+           (network, length, version) of the ranges
+    Output: True if the network is within or covers one of the ranges
+    """
+    for r_network, r_length, r_version in ranges:
+        if r_version != version:
+            continue
+        shift = BITS[version] - min(length, r_length)
+        if network >> shift == r_network >> shift:
+            return True
+    return False
+
+
+def iter_db(fname, networks=None, asns=None, encode=None):
+    """
+    Input: Filename of the mmdb file, list of network strings and list of ASN
+           to filter the networks (None for all), function encoding the data
+           record (default: no encoding)
+    Output: generator of (network string, encoded data record) in the order of
+            the mmdb file
+    """
+    ranges = [parse_prefix(network) for network in networks or ()]
+    asns = None if asns is None else {str(asn) for asn in asns}
+    encode = encode or (lambda data: data)
+    with maxminddb.reader.Reader(fname, maxminddb.MODE_MMAP) as mreader:
+
+        @lru_cache(maxsize=CACHE_SIZE)
+        def record(pointer):
+            # pylint: disable=protected-access
+            data = mreader._resolve_data_pointer(pointer)
+            if asns is not None:
+                try:
+                    if str(data["autonomous_system_number"]) not in asns:
+                        return None
+                except (KeyError, TypeError):
+                    return None
+            return (encode(data),)
+
+        for network, length, version, pointer in data_networks(mreader):
+            if ranges and not overlaps(network, length, version, ranges):
+                continue
+            encoded = record(pointer)
+            if encoded is not None:
+                yield format_prefix(network, length, version), encoded[0]
+
+
+def csv_row(data):
+    """csv columns (CSV_FIELDS) of a data record"""
+    data = data if isinstance(data, dict) else {}
+    values = [data.get(field, "") for field in CSV_FIELDS]
+    out = io.StringIO()
+    csv.writer(out, lineterminator="").writerow(
+        [json.dumps(v) if isinstance(v, (dict, list)) else v for v in values]
+    )
+    return out.getvalue()
+
+
+def ndjson_lines(items):
+    """one json object per line: {"network": , "data": }"""
+    for network, data in items:
+        yield f'{{"network": "{network}", "data": {data}}}\n'
+
+
+def json_lines(items):
+    """json array of [network, data], one network per line"""
+    separator = "[\n"
+    for network, data in items:
+        yield f'{separator}["{network}", {data}]'
+        separator = ",\n"
+    yield "[]\n" if separator == "[\n" else "\n]\n"
+
+
+def csv_lines(items):
+    """network, CSV_FIELDS columns"""
+    yield ",".join(("network",) + CSV_FIELDS) + "\n"
+    for network, data in items:
+        yield f"{network},{data}\n"
+
+
+FORMATS = {
+    "ndjson": (ndjson_lines, json.dumps),
+    "json": (json_lines, json.dumps),
+    "csv": (csv_lines, csv_row),
+}
+
+
+def export_db(fname, outfile, output_format="ndjson", networks=None, asns=None):
+    """
+    Input: Filename of the mmdb file, file object of the output, output format
+           (ndjson, json or csv), list of network strings and list of ASN to
+           filter the networks (None for all)
+    Output: Number of networks written
+    Workflow: The networks are read from the search tree one by one and written
+              in batches of WRITE_BATCH lines, the memory used does not depend
+              on the number of networks.
+    """
+    lines, encode = FORMATS[output_format]
+    count = 0
+
+    def counted(items):
+        nonlocal count
+        for item in items:
+            count += 1
+            yield item
+
+    batch = []
+    for line in lines(counted(iter_db(fname, networks, asns, encode))):
+        batch.append(line)
+        if len(batch) >= WRITE_BATCH:
+            outfile.write("".join(batch))
+            batch.clear()
+    outfile.write("".join(batch))
+    return count
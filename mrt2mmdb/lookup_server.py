@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+"""
+This module answer ip address lookups from a mmdb file opened once and shared
+by all the requests. The mmdb file is reopened when it is replaced or
+modified, a new mmdb file can be dropped in place while the service is
+running. The service listen on a tcp address (host:port) or a unix socket
+(unix:<path>) and answer with json:
+    GET  /?ip=1.1.1.1&ip=2001:db8::1
+    POST /  with a json list of ip addresses as body
+"""
+import ipaddress
+import json
+import logging
+import os
+import socket
+import socketserver
+import stat
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import maxminddb
+
+# seconds between two checks of the mmdb file for a reload
+RELOAD_INTERVAL = 1.0
+# maximum size of the body of a batch request
+MAX_BODY_SIZE = 16 * 1024 * 1024
+# prefix of the address of a unix socket
+UNIX_PREFIX = "unix:"
+METADATA_FIELDS = (
+    "binary_format_major_version",
+    "binary_format_minor_version",
+    "build_epoch",
+    "database_type",
+    "description",
+    "ip_version",
+    "languages",
+    "node_count",
+    "record_size",
+)
+
+
+class SharedReader:
+    """
+    Reader of a mmdb file shared by many lookups. The file is checked at most
+    every interval seconds and a new reader is swapped in when the file has
+    changed, the lookups in progress keep using the previous reader. A file
+    that cannot be opened (eg. partly written) is logged and the previous
+    reader is kept until the file changes again.
+    """
+
+    def __init__(self, fname, interval=RELOAD_INTERVAL):
+        self.fname = fname
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._key = None
+        self._reader = None
+        self.reload()
+
+    def _file_key(self):
+        stat = os.stat(self.fname)
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def reload(self):
+        """open the mmdb file again if it changed, return True if reloaded"""
+        with self._lock:
+            self._checked = time.monotonic()
+            try:
+                key = self._file_key()
+            except OSError:
+                # keep serving the current file while it is being replaced
+                return False
+            if key == self._key:
+                return False
+            try:
+                reader = maxminddb.open_database(self.fname, maxminddb.MODE_AUTO)
+            except (maxminddb.InvalidDatabaseError, OSError, ValueError) as e:
+                if self._reader is None:
+                    raise
+                logging.getLogger(__name__).warning(
+                    f" unable to reload {self.fname}: {e}"
+                )
+                # not tried again until the file changes
+                self._key = key
+                return False
+            self._reader = reader
+            self._key = key
+            return True
+
+    @property
+    def reader(self):
+        """current maxminddb reader, reloaded when the file has changed"""
+        if time.monotonic() - self._checked >= self.interval:
+            self.reload()
+        return self._reader
+
+    def get(self, ipadd):
+        """
+        Input: ip address string
+        Output: dict of the ip address, the network and the data of the network
+                (None when the ip address is not in the database)
+        """
+        data, prefix_len = self.reader.get_with_prefix_len(ipadd)
+        network = None
+        if data is not None:
+            network = str(ipaddress.ip_network((ipadd, prefix_len), strict=False))
+        return {"ip": ipadd, "network": network, "data": data}
+
+    def get_many(self, ipadds):
+        """lookup a list of ip addresses, invalid addresses report an error"""
+        result = []
+        for ipadd in ipadds:
+            try:
+                result.append(self.get(ipadd))
+            except (TypeError, ValueError) as e:
+                result.append({"ip": ipadd, "error": str(e)})
+        return result
+
+    def metadata(self):
+        """metadata of the current mmdb file as a dict"""
+        metadata = self.reader.metadata()
+        return {field: getattr(metadata, field) for field in METADATA_FIELDS}
+
+
+class LookupHandler(BaseHTTPRequestHandler):
+    """json lookup requests, the SharedReader is an attribute of the server"""
+
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, status, result):
+        body = json.dumps(result, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """lookup the ip addresses of the query string, ?ip=<ip>[&ip=<ip>...]"""
+        url = urlsplit(self.path)
+        if url.path == "/metadata":
+            self._reply(200, self.server.reader.metadata())
+            return
+        ipadds = parse_qs(url.query).get("ip", [])
+        if not ipadds:
+            self._reply(400, {"error": "missing ip parameter"})
+        elif len(ipadds) == 1:
+            result = self.server.reader.get_many(ipadds)[0]
+            self._reply(400 if "error" in result else 200, result)
+        else:
+            self._reply(200, self.server.reader.get_many(ipadds))
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """lookup the json list of ip addresses of the body"""
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            self._reply(400, {"error": "invalid Content-Length"})
+            return
+        if length > MAX_BODY_SIZE:
+            self.close_connection = True
+            self._reply(413, {"error": "request too large"})
+            return
+        try:
+            ipadds = json.loads(self.rfile.read(length))
+        except ValueError as e:
+            self._reply(400, {"error": str(e)})
+            return
+        if not isinstance(ipadds, list):
+            self._reply(400, {"error": "body should be a json list of ip addresses"})
+            return
+        self._reply(200, self.server.reader.get_many(ipadds))
+
+    def address_string(self):
+        # unix socket clients have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class HTTP6Server(ThreadingHTTPServer):
+    """ThreadingHTTPServer listening on an ipv6 address"""
+
+    address_family = socket.AF_INET6
+
+
+class UnixHTTPServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer listening on a unix socket"""
+
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        # only a socket left by a previous server is replaced
+        try:
+            mode = os.stat(self.server_address).st_mode
+        except FileNotFoundError:
+            mode = None
+        if mode is not None:
+            if not stat.S_ISSOCK(mode):
+                raise FileExistsError(
+                    f"{self.server_address} exists and is not a unix socket"
+                )
+            os.unlink(self.server_address)
+        # HTTPServer.server_bind expect a (host, port) address
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = self.server_address
+        self.server_port = 0
+
+
+def make_server(fname, address, verbose=False):
+    """
+    Input: Filename of the mmdb file and the address to listen on, host:port
+           for tcp or unix:<path> for a unix socket
+    Output: the http server, call serve_forever() to answer the requests
+    """
+    if address.startswith(UNIX_PREFIX):
+        server = UnixHTTPServer(address[len(UNIX_PREFIX) :], LookupHandler)
+    else:
+        host, port = address.rsplit(":", 1) if ":" in address else (address, "")
+        if not port.isdigit():
+            raise ValueError(
+                f"{address} is not a host:port or {UNIX_PREFIX}<path> address"
+            )
+        host = host.strip("[]")
+        server_class = HTTP6Server if ":" in host else ThreadingHTTPServer
+        server = server_class((host, int(port)), LookupHandler)
+    server.daemon_threads = True
+    server.reader = SharedReader(fname)
+    server.verbose = verbose
+    return server
+
+
+def serve(fname, address, verbose=False):
+    """answer the lookups until interrupted"""
+    server = make_server(fname, address, verbose)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if isinstance(server, UnixHTTPServer):
+            os.unlink(server.server_address)
@@ -4,14 +4,17 @@ This module convert a mrt to mmdb format. This conversion also enrich the
 new mmdb file with network description whereby a more rich and complete
 information can be obtained from a routing prefix.
 """
+import io
 import itertools
 import time
 import logging
+from array import array
+from collections import ChainMap
+from concurrent.futures import ProcessPoolExecutor
 from functools import wraps
-from netaddr import IPSet, IPNetwork
-from mmdb_writer import MMDBWriter
 from tqdm import tqdm
 import maxminddb
+import maxminddb.reader
 import mrtparse
 from args import (
     get_args,
@@ -23,12 +26,42 @@ from args import (
     custom_lookup_only_arg,
     quiet_arg,
     bgpscan_arg,
+    parser_arg,
+    stream_arg,
+    updates_arg,
+    base_arg,
+    workers_arg,
+    cache_size_arg,
+    cache_policy_arg,
+    no_cache_arg,
+    asn_index_arg,
     prometheus_arg,
     database_type_arg,
     log_level_arg,
 )
-from bgpscanner import parse_bgpscanner, sanitize
+from asn_cache import cache_filename, load_asn_cache, save_asn_cache
+from asn_prefix import index_filename, save_asn_prefix
+from bgpscanner import parse_bgpscanner, iter_bgpscanner, sanitize
+from mmdb_tree import TreeBuilder, data_networks, data_records
+from mrt_file import is_compressed, mrt_offsets, mrt_ranges, open_mrt
+from mrt_native import iter_native, iter_rib_routes
+from mrt_updates import iter_updates
+from prefix_table import (
+    LOW_MASK,
+    PathTable,
+    PrefixTable,
+    format_prefix,
+    parse_prefix,
+)
 from prometheus import output_prometheus
+from rib_snapshot import load_snapshot, save_snapshot, snapshot_filename
+from rib_state import (
+    STATE_SUFFIX,
+    RibState,
+    load_state,
+    save_state,
+    state_filename,
+)
 from file_stats import all_files_create, arguments_filename
 from flat_file import parse_flatfile
 
@@ -65,14 +98,20 @@ def make_asn_custom(fname, logger, quiet=False):
 
 
 @timeit
-def make_asn(fname, logger, quiet=False):
+def make_asn(fname, logger, quiet=False, cache=True):
     """
     Input:  A complete mmdb file that contains prefixes with ASN and description
     Output: Return a ASN lookup dictionary that provides a description for each ASN
             The ASN dictionary discard the prefix information. This dictionary
             is a direct ASN->Description relationship.
             Print the progress while processing each prefixes
-    Workflow: Iterate over the mmdb entries to create the desire dictionary
+    Workflow: Unpack the search tree of the mmdb file to find the distinct data
+              records and decode each of them once (data_records), instead of
+              decoding the record of every prefix. The count is still the
+              number of prefixes.
+              When cache is set, the table is saved into <mmdb>.asncache and
+              the next run return the cache (a read only mapping) as long as
+              the mmdb file is unchanged.
     """
     asn = {}
     count = 0
@@ -81,22 +120,26 @@ def make_asn(fname, logger, quiet=False):
     if fname == "":
         logger.warning(f" {message: <80}  : skipped")
         return asn, count
-    with maxminddb.open_database(fname, 1) as mreader:
+    if cache and (cached := load_asn_cache(fname)) is not None:
+        logger.warning(f" {message: <80}  : cached")
+        return cached
+    with maxminddb.reader.Reader(fname, maxminddb.MODE_MMAP) as mreader:
+        count, records = data_records(mreader)
         with tqdm(
             desc=f" {message: <80}  ",
-            unit=" prefixes",
+            unit=" records",
             disable=quiet,
         ) as pb:
-            for prefix, data in mreader:
+            for data in records:
                 try:
-                    del prefix
                     asn[str(data["autonomous_system_number"])] = data[
                         "autonomous_system_organization"
                     ]
                     pb.update(1)
-                    count += 1
                 except KeyError:
                     pass
+    if cache and not save_asn_cache(fname, asn, count):
+        logger.warning(f" unable to write {cache_filename(fname)}")
     return asn, count
 
 
@@ -105,36 +148,44 @@ def make_routing(fname, quiet=False):
     """
     Input:  A complete mmdb file that contains prefixes with ASN and description
     Output: Return a prefix lookup dictionary with ASN as it's value
+    Workflow: The networks are read from the unpacked search tree
+              (data_networks) and the ASN of each distinct data record is
+              decoded once, the prefixes sharing a record share its ASN string.
     """
     routing = {}
     count = 0
+    asns = {}
     # Make Maxmind ASN lookup table
     message = "Making routing table dictionary with prefix-key and ASN-value"
-    with maxminddb.open_database(fname, 1) as mreader:
+    with maxminddb.reader.Reader(fname, maxminddb.MODE_MMAP) as mreader:
         with tqdm(
             desc=f" {message:<40}  ",
             unit=" prefixes",
             disable=quiet,
         ) as pb:
-            for prefix, data in mreader:
+            for network, length, version, pointer in data_networks(mreader):
                 try:
-                    routing[str(prefix)] = str(data["autonomous_system_number"])
+                    asn = asns[pointer]
+                except KeyError:
+                    # pylint: disable=protected-access
+                    data = mreader._resolve_data_pointer(pointer)
+                    try:
+                        asn = str(data["autonomous_system_number"])
+                    except (KeyError, TypeError):
+                        asn = None
+                    asns[pointer] = asn
+                if asn is not None:
+                    routing[format_prefix(network, length, version)] = asn
                     pb.update(1)
                     count += 1
-                except KeyError:
-                    pass
     return routing, count
 
 
-def make_dict(i, result):
+def rib_entry(i):
     """
-    Input: One mrt entry and a aggregated entries (result). This aggregated entries
-           (dictionary) allow quick lookup of a prefix (key) and fetch the values
-           (AS_PATH and the prefix).
-    Output: Aggregated mrt entries in dictionary (prefix-> AS_PATH/PREFIX)
-    Workflow: Check the mmrt entry for "rib_entries" as this branch contains the
-              required routing information such as AS_PATH. This information are
-              used to forma mrt entry in dictionary then return back to the caller.
+    Input: One mrt entry
+    Output: Tuple of prefix and AS_PATH of the first rib entry, None if the mrt
+            entry has no rib entries or AS_PATH
     """
     if ("rib_entries" in i.data) and (
         len(i.data["rib_entries"][0]["path_attributes"][1]["value"]) > 0
@@ -149,63 +200,186 @@ def make_dict(i, result):
             )
         except IndexError:
             pass
-        result[prefix] = [aspath, prefix]
+        return prefix, aspath
+    return None
+
+
+def make_dict(i, result):
+    """
+    Input: One mrt entry and a aggregated entries (result). This aggregated entries
+           (PrefixTable) allow quick lookup of a prefix (key) and fetch the value
+           (AS_PATH).
+    Output: Aggregated mrt entries in PrefixTable (prefix-> AS_PATH)
+    Workflow: Check the mmrt entry for "rib_entries" as this branch contains the
+              required routing information such as AS_PATH. This information are
+              used to forma mrt entry in dictionary then return back to the caller.
+    """
+    entry = rib_entry(i)
+    if entry:
+        result[entry[0]] = entry[1]
     return result
 
 
+def iter_mrtparse(fname, num_prefix, workers=1):
+    """
+    Generator of (prefix, AS_PATH) of each mrt entry parsed by mrtparse module.
+    None is generated for the mrt entries without AS_PATH. Compressed files
+    are decompressed in the background (open_mrt).
+    """
+    with open_mrt(fname, workers) as fh:
+        mrt = mrtparse.Reader(fh)
+        for i in itertools.islice(mrt, num_prefix):
+            yield rib_entry(i)
+
+
 def parse_mrtparse(fname, pb, result, num_prefix):
     """Parseing of the mrtf file using mrtparse module"""
     count = 0
-    mrt = mrtparse.Reader(fname)
-    for i in itertools.islice(mrt, num_prefix):
-        result = make_dict(i, result)
+    for entry in iter_mrtparse(fname, num_prefix, args.workers):
+        if entry:
+            result[entry[0]] = entry[1]
         pb.update(1)
         count += 1
     return result, count
 
 
+def parse_native(fname, pb, result, num_prefix):
+    """Parsing of the mrt file using the built-in TABLE_DUMP_V2 decoder"""
+    count = 0
+    for entry in iter_native(fname, num_prefix, workers=args.workers):
+        if entry:
+            result.add(*entry)
+        pb.update(1)
+        count += 1
+    return result, count
+
+
+def iter_entries(fname, num_prefix):
+    """
+    Generator of (network, prefix length, ip version, AS_PATH) of each mrt entry
+    parsed by the selected parser (--parser). None is generated for the mrt
+    entries without AS_PATH.
+    """
+    if args.parser == "native":
+        yield from iter_native(fname, num_prefix, workers=args.workers)
+        return
+    if args.parser == "bgpscanner":
+        entries = iter_bgpscanner(fname, num_prefix)
+    else:
+        entries = iter_mrtparse(fname, num_prefix, args.workers)
+    for entry in entries:
+        yield entry and (*parse_prefix(entry[0]), entry[1])
+
+
+def parse_mrt_range(fname, start, end, parser):
+    """
+    Worker of parse_mrt_workers. Parse the mrt entries between the byte
+    offsets start and end of the mrt file into a PrefixTable.
+    """
+    result = PrefixTable()
+    if parser == "native":
+        for entry in iter_native(fname, None, start, end):
+            if entry:
+                result.add(*entry)
+        return result
+    with open(fname, "rb") as fh:
+        fh.seek(start)
+        data = io.BytesIO(fh.read(end - start))
+    for i in mrtparse.Reader(data):
+        make_dict(i, result)
+    return result
+
+
+def parse_mrt_workers(fname, pb, result, num_prefix, workers):
+    """
+    Parsing of the mrt file using mrtparse module or the built-in decoder
+    (--parser) in a pool of worker processes.
+    The file is split into byte ranges on the mrt entry boundaries, each range
+    is parsed by a worker and the PrefixTable of the ranges are merged in file
+    order, a prefix seen in several ranges keeps the last entry like make_dict.
+    """
+    offsets = mrt_offsets(fname, num_prefix)
+    ranges = mrt_ranges(offsets, workers * 4)
+    count = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(parse_mrt_range, fname, start, end, args.parser)
+            for start, end, _ in ranges
+        ]
+        for future, (_, _, entries) in zip(futures, ranges):
+            result.update(future.result())
+            pb.update(entries)
+            count += entries
+    return result, count
+
+
 @timeit
 def load_mrt(fname):
     """
     Input: file of the mrt file.
-    Output: Aggregated mrt entries in dictionary (prefix-> AS_PATH/PREFIX)
-            Print the progress while processing each entry.
-    Workflow: Iterate over the mrt entries (parsed by mrtparse module) to
-              form the output dictionary
+    Output: Aggregated mrt entries in PrefixTable (prefix-> AS_PATH) bucketed
+            by prefix length. Print the progress while processing each entry.
+    Workflow: Iterate over the mrt entries (parsed by mrtparse module, bgpscanner
+              or the built-in decoder) to form the output PrefixTable.
+              The PrefixTable is saved into <mrt>.ribsnap and the next runs
+              load the snapshot instead of parsing the mrt file, as long as the
+              mrt file and the parser are unchanged (unless --no_cache).
     """
     num_prefix = args.prefixes
-    result = {}
     message = "Loading mrt data into dictionary using " + fname
+    logger = logging.getLogger(__name__)
+    if not args.no_cache and (
+        cached := load_snapshot(fname, num_prefix, args.parser)
+    ):
+        logger.warning(f" {message: <80}  : snapshot")
+        return cached
+    result = PrefixTable()
     with tqdm(
         desc=f" {message: <80}  ",
         unit=" prefixes",
         disable=args.quiet,
     ) as pb:
-        if args.bgpscan:
-            return parse_bgpscanner(fname, pb, result, num_prefix)
-        return parse_mrtparse(fname, pb, result, num_prefix)
+        if args.parser == "bgpscanner":
+            result, count = parse_bgpscanner(fname, pb, result, num_prefix)
+        elif args.workers > 1 and not is_compressed(fname):
+            result, count = parse_mrt_workers(
+                fname, pb, result, num_prefix, args.workers
+            )
+        elif args.parser == "native":
+            result, count = parse_native(fname, pb, result, num_prefix)
+        else:
+            result, count = parse_mrtparse(fname, pb, result, num_prefix)
+    if not args.no_cache and not save_snapshot(
+        fname, result, count, num_prefix, args.parser
+    ):
+        logger.warning(f" unable to write {snapshot_filename(fname)}")
+    return result, count
 
 
 @timeit
 def convert_mrt_mmdb(fname, mrt, asn, quiet=False):
     """
     Input: Filename of the target mmdb file.
-           Dictionary of the prefix->AS_PATH/PREFIX derive from previous mrt file
+           PrefixTable of the prefix->AS_PATH derive from previous mrt file
            Dictionary of the ASN->Decsription
     Output: Create a mmdb file on the target path
             Report any missing description as some ASN inside the mrt may not exist
             in the ASN->Decsription dictionary. This must be reported as missing
             entries.
             Print the progress of the process.
-    Workflow: Iterate over the dictionary (prefix->AS_PATH/PREFIX) and derive the
-              ASN of destination using AS_PATH. Using this ASN of destionation, do
-              a lookup via the Dictionary of the ASN->Decsription. With all these
-              data we can form a mmdb entry and using writer.insert_network to
-              populate the mmdb. After the completion of the iteration, write
-              all mmdb entries into the target file.
+    Workflow: Iterate over the PrefixTable (prefix->AS_PATH) from the least to the
+              most specific prefix and derive the ASN of destination using AS_PATH.
+              Using this ASN of destionation, do a lookup via the Dictionary of
+              the ASN->Decsription. With all these data we can form a mmdb entry
+              and using writer.insert to populate the search tree. After the
+              completion of the iteration, write all mmdb entries into the
+              target file.
+              The fields given by the AS_PATH are made once per distinct AS_PATH
+              (PathTable of the PrefixTable), the records of the prefixes sharing
+              an AS_PATH share the same ASN, description and AS_PATH strings.
     """
     missing = []
-    writer = MMDBWriter(
+    writer = TreeBuilder(
         ip_version=6, ipv4_compatible=True, database_type=args.database_type
     )
     count = 0
@@ -215,37 +389,207 @@ def convert_mrt_mmdb(fname, mrt, asn, quiet=False):
         unit=" prefixes",
         disable=quiet,
     ) as pb:
-        for prefix in sorted(mrt.keys(), key=lambda x: IPNetwork(x).size, reverse=True):
-            try:
-                val = mrt[prefix]
-                as_num = sanitize(str(val[0][-1]))
-                if as_num in asn:
-                    org_desc = asn[as_num]
-                else:
-                    missing.append(as_num)
-                    org_desc = ""
-            except IndexError:
-                pass
-            writer.insert_network(
-                IPSet(IPNetwork(prefix)),
-                {
-                    "autonomous_system_number": int(as_num),
-                    "autonomous_system_organization": org_desc,
-                    "prefix": str(prefix),
-                    "path": " ".join(val[0]),
-                },
+        paths = mrt.paths
+        fields = [None] * len(paths)
+        for network, length, version, path_id in mrt.entries():
+            if fields[path_id] is None:
+                fields[path_id] = path_fields(paths[path_id], asn)
+            record = path_record(
+                format_prefix(network, length, version), fields[path_id], missing
             )
+            writer.insert(network, length, record, version)
+            pb.update(1)
+            count += 1
+    write_mmdb(writer, fname)
+    return missing, count
+
+
+@timeit
+def stream_mrt_mmdb(fname, mrt_fname, asn, quiet=False):
+    """
+    Input: Filename of the target mmdb file.
+           Filename of the mrt file.
+           Dictionary of the ASN->Decsription
+    Output: Create a mmdb file on the target path and report the missing
+            description like convert_mrt_mmdb.
+    Workflow: The mrt entries are inserted into the search tree as they are
+              parsed without loading the whole mrt file into a PrefixTable first.
+              A prefix seen again replace the previous entry like in make_dict.
+              Each entry is kept as a row of array columns (network, prefix
+              length, ip version, id of the AS_PATH in the PathTable) and the
+              search tree only holds the row, the mmdb record of a row is made
+              when the data section is encoded (TreeBuilder resolve).
+    """
+    missing = []
+    paths = PathTable()
+    fields = []
+    high = array("Q")
+    low = array("Q")
+    lengths = array("B")
+    versions = array("B")
+    path_ids = array("I")
+
+    def resolve(row):
+        network = high[row] << 64 | low[row]
+        prefix = format_prefix(network, lengths[row], versions[row])
+        return path_record(prefix, fields[path_ids[row]], missing)
+
+    writer = TreeBuilder(
+        ip_version=6,
+        ipv4_compatible=True,
+        database_type=args.database_type,
+        resolve=resolve,
+    )
+    count = 0
+    message = "Streaming mrt into mmda " + fname + " using " + mrt_fname
+    with tqdm(
+        desc=f" {message: <80}  ",
+        unit=" prefixes",
+        disable=quiet,
+    ) as pb:
+        for entry in iter_entries(mrt_fname, args.prefixes):
             pb.update(1)
             count += 1
+            if entry is None:
+                continue
+            network, length, version, aspath = entry
+            path_id = paths.intern(aspath)
+            if path_id == len(fields):
+                fields.append(path_fields(aspath, asn))
+            writer.insert(network, length, len(path_ids), version)
+            high.append(network >> 64)
+            low.append(network & LOW_MASK)
+            lengths.append(length)
+            versions.append(version)
+            path_ids.append(path_id)
+    write_mmdb(writer, fname)
+    return missing, count
+
+
+@timeit
+def load_updates(base, updates, rib=None):
+    """
+    Input: Filename of the previous target mmdb file, the filenames of the mrt
+           update files and the filename of the mrt RIB dump the updates start
+           from (None to start from the state of the previous target)
+    Output: RibState of the routes of each peer once the updates are applied
+    Workflow: The state is made from every rib entry of the RIB dump, or loaded
+              from <base>.ribstate. The announcements and withdrawals of the
+              update files are then applied in file order to the routes of
+              their peer, the last one wins. A withdrawal only remove the route
+              of its peer, the prefix is kept while another peer has a route.
+    """
+    count = 0
+    if rib is None:
+        message = "Loading routes of each peer " + state_filename(base)
+        state = load_state(base)
+        if state is None:
+            raise ValueError(
+                f"{state_filename(base)} is not a valid state, give the mrt RIB"
+                " dump the updates start from with --mrt"
+            )
+        if not args.quiet:
+            logging.getLogger(__name__).warning(
+                f" {message: <80}  : {len(state.peers)} peers"
+            )
+    else:
+        state = RibState()
+        message = "Loading routes of each peer using " + rib
+        with tqdm(
+            desc=f" {message: <80}  ",
+            unit=" routes",
+            disable=args.quiet,
+        ) as pb:
+            for network, length, version, peer, aspath in iter_rib_routes(
+                rib, args.prefixes, args.workers
+            ):
+                if network is None:
+                    # peer of the PEER_INDEX_TABLE, ranked by its index
+                    state.table(peer)
+                    continue
+                state.announce(network, length, version, peer, aspath)
+                pb.update(1)
+    for fname in updates:
+        message = "Applying mrt updates " + fname
+        with tqdm(
+            desc=f" {message: <80}  ",
+            unit=" prefixes",
+            disable=args.quiet,
+        ) as pb:
+            for network, length, version, aspath, peer in iter_updates(
+                fname, args.workers
+            ):
+                if aspath is None:
+                    state.withdraw(network, length, version, peer)
+                else:
+                    state.announce(network, length, version, peer, aspath)
+                pb.update(1)
+                count += 1
+    return state, count
+
+
+def path_fields(aspath, asn):
+    """
+    Input: AS_PATH and dictionary of the ASN->Decsription
+    Output: Tuple of the fields of the mmdb record given by the AS_PATH: ASN of
+            destination (last ASN of the AS_PATH), its description, the AS_PATH
+            string and the ASN (str) when there is no description (else None)
+    """
+    as_num = sanitize(str(aspath[-1])) if aspath else "0"
+    if as_num in asn:
+        return int(as_num), asn[as_num], " ".join(aspath), None
+    return int(as_num), "", " ".join(aspath), as_num
+
+
+def path_record(prefix, fields, missing):
+    """
+    Input: Prefix, fields given by path_fields and the list of ASN without
+           description
+    Output: The mmdb record of the prefix, the ASN is added to missing when
+            there is no description
+    """
+    as_num, org_desc, path, no_desc = fields
+    if no_desc is not None:
+        missing.append(no_desc)
+    return {
+        "autonomous_system_number": as_num,
+        "autonomous_system_organization": org_desc,
+        "prefix": prefix,
+        "path": path,
+    }
+
+
+def write_mmdb(writer, fname):
+    """
+    Write the search tree and records into the target mmdb file, the cache
+    statistics of the encoder are logged (INFO)
+    """
     message = "Writing mmda file " + fname
     with tqdm(
         desc=f" {message: <80}  ",
         unit="",
         disable=args.quiet,
     ) as pb:
-        writer.to_db_file(fname)
+        stats = writer.to_db_file(
+            fname, args.cache_size, args.cache_policy, args.workers
+        )
         pb.update(1)
-    return missing, count
+    logging.getLogger(__name__).info(
+        f" {'Encoder cache ' + stats['policy']: <80}  : hit rate"
+        f" {stats['hit_rate']:.1%}, {stats['bytes_saved']} bytes deduplicated,"
+        f" {stats['evictions']} evictions"
+    )
+
+
+def make_asn_index(fname, quiet=False):
+    """Write the ASN->networks index of the target mmdb file for lookup.py --asn"""
+    message = "Writing ASN index " + index_filename(fname)
+    with tqdm(
+        desc=f" {message: <80}  ",
+        unit=" prefixes",
+        disable=quiet,
+    ) as pb:
+        pb.update(save_asn_prefix(fname))
 
 
 def display_stats(text, stats, logger, quiet=False):
@@ -272,6 +616,15 @@ def main():
             custom_lookup_only_arg,
             quiet_arg,
             bgpscan_arg,
+            parser_arg,
+            stream_arg,
+            updates_arg,
+            base_arg,
+            workers_arg,
+            cache_size_arg,
+            cache_policy_arg,
+            no_cache_arg,
+            asn_index_arg,
             prometheus_arg,
             database_type_arg,
             log_level_arg,
@@ -289,8 +642,11 @@ def main():
     )
     logger = logging.getLogger(__name__)
 
-    args = arguments_filename(parser, logger)
+    args = arguments_filename(parser, logger, STATE_SUFFIX)
 
+    if args.bgpscan:
+        # --bgpscan is kept as a short hand of --parser bgpscanner
+        args.parser = "bgpscanner"
     if args.prometheus:
         # Force quiet mode in order to generate the prometheus output
         args.quiet = True
@@ -298,18 +654,33 @@ def main():
         logging.disable(logging.WARNING)
     logger.debug(args)
 
-    asn, asn_stats = make_asn(args.mmdb, logger, args.quiet)
+    asn, asn_stats = make_asn(args.mmdb, logger, args.quiet, not args.no_cache)
     asn_custom, asn_custom_stats = make_asn_custom(args.lookup_file, logger, args.quiet)
     if args.custom_lookup_only:
         asn = asn_custom
         asn_stats = asn_custom_stats
     else:
-        # merge asn lookup table for combination lookup
-        asn.update(asn_custom)
-    prefixes_mrt, prefix_stats = load_mrt(args.mrt)
-    missing, convert_stats = convert_mrt_mmdb(
-        args.target, prefixes_mrt, asn, args.quiet
-    )
+        # combination lookup, the lookup file wins over the mmdb (the cached
+        # asn table is read only)
+        asn = ChainMap(asn_custom, asn)
+    if args.updates:
+        state, prefix_stats = load_updates(args.base, args.updates, args.rib)
+        missing, convert_stats = convert_mrt_mmdb(
+            args.target, state.best(), asn, args.quiet
+        )
+        if not save_state(args.target, state):
+            logger.warning(f" unable to write {state_filename(args.target)}")
+    elif args.stream:
+        missing, convert_stats = stream_mrt_mmdb(args.target, args.mrt, asn, args.quiet)
+        # loading and conversion of the mrt entries are done in a single pass
+        prefix_stats = convert_stats
+    else:
+        prefixes_mrt, prefix_stats = load_mrt(args.mrt)
+        missing, convert_stats = convert_mrt_mmdb(
+            args.target, prefixes_mrt, asn, args.quiet
+        )
+    if args.asn_index:
+        make_asn_index(args.target, args.quiet)
     display_stats("Prefixes without description", missing, logger, args.quiet)
     display_stats("ASN without description", set(missing), logger, args.quiet)
     files_stats = all_files_create(
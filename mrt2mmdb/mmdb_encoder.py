@@ -10,6 +10,9 @@ import logging
 import math
 import struct
 import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from typing import Union
 
 from netaddr import IPSet, IPNetwork
@@ -22,81 +25,164 @@ logger = logging.getLogger(__name__)
 METADATA_MAGIC = b"\xab\xcd\xefMaxMind.com"
 
 
-class Encoder(object):
+# header of the values shorter than HEADER_CACHE_SIZE are precomputed
+HEADER_CACHE_SIZE = 285
+# all: every distinct value is cached
+# leaf: the strings, numbers and the maps/arrays without nested map or array
+#       (eg. the names of a city) are cached, the records are not
+CACHE_POLICIES = ("all", "leaf")
+DOUBLE = struct.Struct(">d")
+INT32 = struct.Struct(">i")
+FLOAT = struct.Struct(">f")
+
+
+def make_header(type_id, length):
+    """control byte(s) of a value of type_id and length (item count for map/array)"""
+    if length >= 16843036:
+        raise Exception("length >= 16843036")
+    elif length >= 65821:
+        five_bits = 31
+        additional_length_bytes = (length - 65821).to_bytes(3, "big")
+    elif length >= 285:
+        five_bits = 30
+        additional_length_bytes = (length - 285).to_bytes(2, "big")
+    elif length >= 29:
+        five_bits = 29
+        additional_length_bytes = bytes((length - 29,))
+    else:
+        five_bits = length
+        additional_length_bytes = b""
+
+    if type_id <= 7:
+        res = bytes(((type_id << 5) + five_bits,))
+    else:
+        res = bytes((five_bits, type_id - 7))
+    return res + additional_length_bytes
+
+
+HEADERS = {
+    type_id: [make_header(type_id, length) for length in range(HEADER_CACHE_SIZE)]
+    for type_id in range(1, 16)
+}
+
 
-    def __init__(self, cache=True):
-        self.data_cache = {}
+class Encoder(object):
+    """
+    Encoder of the data section. With cache, every distinct value (map, array,
+    string, number) is written once into the data bytearray and encode returns
+    a pointer to it. The cache key of a string or an integer is the value, the
+    cache key of the other values is their encoding: a map or an array is
+    encoded from the pointers of its items, each value is hashed once and
+    no frozen copy of the records is kept.
+    The cache keeps every value (cache_size=0) or the cache_size values used
+    last (LRU), the cache_policy selects the values cached (CACHE_POLICIES).
+    A value evicted or not cached is written again when it is encoded again,
+    the data section stays valid but less deduplicated.
+    """
+
+    def __init__(self, cache=True, cache_size=0, cache_policy="all"):
+        if cache_policy not in CACHE_POLICIES:
+            raise ValueError(f"unknown cache_policy={cache_policy}")
+        if cache_size < 0:
+            raise ValueError(f"cache_size should be >= 0, {cache_size} is incorrect")
+        self.data_cache = OrderedDict() if cache_size else {}
         self.pointer_cache = {}
-        self.data_list = []
-        self.data_pointer = 0
+        self.data = bytearray()
         self.cache = cache
+        self.cache_size = cache_size
+        self.cache_policy = cache_policy
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+    @property
+    def data_pointer(self):
+        """size of the data section written so far"""
+        return len(self.data)
+
+    @property
+    def data_list(self):
+        """the data section, kept for the callers joining a list of chunks"""
+        return [self.data]
 
     def _encode_pointer(self, value):
         pointer = value
         if pointer >= 134744064:
-            res = struct.pack(">BI", 0x38, pointer)
-        elif pointer >= 526336:
+            return b"\x38" + pointer.to_bytes(4, "big")
+        if pointer >= 526336:
             pointer -= 526336
-            res = struct.pack(
-                ">BBBB",
-                0x30 + ((pointer >> 24) & 0x07),
-                (pointer >> 16) & 0xFF,
-                (pointer >> 8) & 0xFF,
-                pointer & 0xFF,
-            )
-        elif pointer >= 2048:
+            return bytes((0x30 + ((pointer >> 24) & 0x07),)) + (
+                pointer & 0xFFFFFF
+            ).to_bytes(3, "big")
+        if pointer >= 2048:
             pointer -= 2048
-            res = struct.pack(
-                ">BBB",
-                0x28 + ((pointer >> 16) & 0x07),
-                (pointer >> 8) & 0xFF,
-                pointer & 0xFF,
+            return bytes(
+                (0x28 + ((pointer >> 16) & 0x07), (pointer >> 8) & 0xFF, pointer & 0xFF)
             )
-        else:
-            res = struct.pack(">BB", 0x20 + ((pointer >> 8) & 0x07), pointer & 0xFF)
-
-        return res
+        return bytes((0x20 + ((pointer >> 8) & 0x07), pointer & 0xFF))
 
     def _encode_utf8_string(self, value):
         encoded_value = value.encode("utf-8")
-        res = self._make_header(2, len(encoded_value))
-        res += encoded_value
-        return res
+        return self._make_header(2, len(encoded_value)) + encoded_value
 
     def _encode_bytes(self, value):
         return self._make_header(4, len(value)) + value
 
     def _encode_uint(self, type_id, max_len):
+        headers = HEADERS[type_id]
+        mask = (1 << (8 * max_len)) - 1
+
         def _encode_unsigned_value(value):
-            res = b""
-            while value != 0 and len(res) < max_len:
-                res = struct.pack(">B", value & 0xFF) + res
-                value = value >> 8
-            return self._make_header(type_id, len(res)) + res
+            # the value is truncated to max_len bytes
+            if value < 0:
+                size = max_len
+            else:
+                size = min((value.bit_length() + 7) >> 3, max_len)
+            return headers[size] + (value & mask).to_bytes(size, "big")
 
         return _encode_unsigned_value
 
     def _encode_map(self, value):
-        res = self._make_header(7, len(value))
-        for k, v in list(value.items()):
+        encode = self.encode
+        # the strings already in an unbounded cache are resolved here instead
+        # of calling encode, the LRU cache needs encode to update its order
+        known = {} if self.cache_size else self.data_cache
+        hits = saved = 0
+        res = [self._make_header(7, len(value))]
+        append = res.append
+        for k, v in value.items():
             # Keys are always stored by value.
-            res += self.encode(k)
-            res += self.encode(v)
-        return res
+            entry = known.get(k)
+            if entry is None:
+                append(encode(k))
+            else:
+                append(entry[0])
+                hits += 1
+                saved += entry[1]
+            entry = known.get(v) if type(v) is str else None
+            if entry is None:
+                append(encode(v))
+            else:
+                append(entry[0])
+                hits += 1
+                saved += entry[1]
+        self.hits += hits
+        self.bytes_saved += saved
+        return b"".join(res)
 
     def _encode_array(self, value):
-        res = self._make_header(11, len(value))
-        for k in value:
-            res += self.encode(k)
-        return res
+        encode = self.encode
+        return b"".join([self._make_header(11, len(value))] + [encode(k) for k in value])
 
     def _encode_boolean(self, value):
         return self._make_header(14, 1 if value else 0)
 
     def _encode_pack_type(self, type_id, fmt):
+        header = HEADERS[type_id][fmt.size]
+
         def pack_type(value):
-            res = struct.pack(fmt, value)
-            return self._make_header(type_id, len(res)) + res
+            return header + fmt.pack(value)
 
         return pack_type
 
@@ -108,54 +194,24 @@ class Encoder(object):
             self._type_decoder = {
                 1: self._encode_pointer,
                 2: self._encode_utf8_string,
-                3: self._encode_pack_type(3, ">d"),  # double,
+                3: self._encode_pack_type(3, DOUBLE),  # double,
                 4: self._encode_bytes,
                 5: self._encode_uint(5, 2),  # uint16
                 6: self._encode_uint(6, 4),  # uint32
                 7: self._encode_map,
-                8: self._encode_pack_type(8, ">i"),  # int32
+                8: self._encode_pack_type(8, INT32),  # int32
                 9: self._encode_uint(9, 8),  # uint64
                 10: self._encode_uint(10, 16),  # uint128
                 11: self._encode_array,
                 14: self._encode_boolean,
-                15: self._encode_pack_type(15, ">f"),  # float,
+                15: self._encode_pack_type(15, FLOAT),  # float,
             }
         return self._type_decoder
 
     def _make_header(self, type_id, length):
-        if length >= 16843036:
-            raise Exception("length >= 16843036")
-
-        elif length >= 65821:
-            five_bits = 31
-            length -= 65821
-            b3 = length & 0xFF
-            b2 = (length >> 8) & 0xFF
-            b1 = (length >> 16) & 0xFF
-            additional_length_bytes = struct.pack(">BBB", b1, b2, b3)
-
-        elif length >= 285:
-            five_bits = 30
-            length -= 285
-            b2 = length & 0xFF
-            b1 = (length >> 8) & 0xFF
-            additional_length_bytes = struct.pack(">BB", b1, b2)
-
-        elif length >= 29:
-            five_bits = 29
-            length -= 29
-            additional_length_bytes = struct.pack(">B", length & 0xFF)
-
-        else:
-            five_bits = length
-            additional_length_bytes = b""
-
-        if type_id <= 7:
-            res = struct.pack(">B", (type_id << 5) + five_bits)
-        else:
-            res = struct.pack(">BB", five_bits, type_id - 7)
-
-        return res + additional_length_bytes
+        if length < HEADER_CACHE_SIZE:
+            return HEADERS[type_id][length]
+        return make_header(type_id, length)
 
     _python_type_id = {float: 15, bool: 14, list: 11, dict: 7, bytes: 4, str: 2}
 
@@ -177,15 +233,8 @@ class Encoder(object):
                 return 5
         raise TypeError("unknown type {value_type}".format(value_type=value_type))
 
-    def _freeze(self, value):
-        if isinstance(value, dict):
-            return tuple((k, self._freeze(v)) for k, v in value.items())
-        elif isinstance(value, list):
-            return tuple(self._freeze(v) for v in value)
-        return value
-
     def encode_meta(self, meta):
-        res = self._make_header(7, len(meta))
+        res = [self._make_header(7, len(meta))]
         meta_type = {
             "node_count": 6,
             "record_size": 5,
@@ -196,17 +245,128 @@ class Encoder(object):
         }
         for k, v in list(meta.items()):
             # Keys are always stored by value.
-            res += self.encode(k)
-            res += self.encode(v, meta_type.get(k))
-        return res
+            res.append(self.encode(k))
+            res.append(self.encode(v, meta_type.get(k)))
+        return b"".join(res)
+
+    def _hit(self, cache_key, entry):
+        """count a cache hit, output: the pointer of the cached value"""
+        pointer, saved = entry
+        self.hits += 1
+        self.bytes_saved += saved
+        if self.cache_size:
+            self.data_cache.move_to_end(cache_key)
+        return pointer
+
+    def _add(self, cache_key, pointer, size):
+        """cache the pointer of a value, the least recently used is evicted"""
+        self.data_cache[cache_key] = (pointer, size - len(pointer))
+        if self.cache_size and len(self.data_cache) > self.cache_size:
+            self.data_cache.popitem(last=False)
+            self.evictions += 1
+
+    @staticmethod
+    def _nested(value, type_id):
+        """True if the value is a map or an array holding a map or an array"""
+        if type_id == 7:
+            value = value.values()
+        elif type_id != 11:
+            return False
+        return any(type(v) is dict or type(v) is list for v in value)
+
+    def cache_stats(self):
+        """
+        Output: dict of the statistics of the cache. A hit is a value written
+                as a pointer instead of being written again, bytes_saved is
+                the size of these values less the size of the pointers.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "policy": self.cache_policy,
+            "size": self.cache_size,
+            "entries": len(self.data_cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bytes_written": len(self.data),
+            "bytes_saved": self.bytes_saved,
+        }
+
+    @property
+    def shardable(self):
+        """
+        True if the records can be encoded in shards (merge_shard): the
+        unbounded cache of policy all, the LRU order and the policy leaf
+        depend on the order of every value encoded before
+        """
+        return self.cache and not self.cache_size and self.cache_policy == "all"
+
+    def merge_shard(self, chunks, counts, refs, uses, roots):
+        """
+        Input: shard of a slice of records (ShardEncoder.shard)
+        Output: list of the pointers of the records of the shard
+        Workflow: The values of the shard are written into the data section
+                  in the order they were encoded in the shard, the items of a
+                  map or an array are resolved to the pointers of the values
+                  merged before them. The cache key of every value is its
+                  encoding, a value already in the data section is referred
+                  by its pointer. The values found again in the cache of the
+                  shard are counted as hits of their pointer. Merging the
+                  shards of consecutive slices of records in order gives the
+                  same data section and statistics as encoding the records
+                  one by one (unbounded cache, policy all).
+        """
+        if not self.shardable:
+            raise ValueError(
+                f"cache_size={self.cache_size} cache_policy={self.cache_policy}"
+                " cannot merge shards"
+            )
+        pointers = [None] * len(chunks)
+        resolve = pointers.__getitem__
+        data_cache = self.data_cache
+        data = self.data
+        encode_pointer = self._encode_pointer
+        hits = saved = misses = 0
+        position = 0
+        for local, res in enumerate(chunks):
+            count = counts[local]
+            if count:
+                items = refs[position : position + count]
+                position += count
+                res = res + b"".join(map(resolve, items))
+            entry = data_cache.get(res)
+            if entry is None:
+                pointer = encode_pointer(len(data))
+                data += res
+                misses += 1
+                entry = data_cache[res] = (pointer, len(res) - len(pointer))
+            else:
+                hits += 1
+                saved += entry[1]
+            pointers[local] = entry[0]
+            hits += uses[local]
+            saved += uses[local] * entry[1]
+        self.hits += hits
+        self.bytes_saved += saved
+        self.misses += misses
+        return [pointers[i] for i in roots]
 
     def encode(self, value, type_id=None):
-        if self.cache:
-            try:
-                cache_key = self._freeze(value)
-                return self.data_cache[cache_key]
-            except KeyError:
-                pass
+        cache_key = None
+        if self.cache and not type_id:
+            value_type = type(value)
+            if value_type is str or value_type is int:
+                # strings and integers are their own cache key
+                entry = self.data_cache.get(value)
+                if entry is not None:
+                    # same as _hit, inlined for the most frequent values
+                    self.hits += 1
+                    self.bytes_saved += entry[1]
+                    if self.cache_size:
+                        self.data_cache.move_to_end(value)
+                    return entry[0]
+                cache_key = value
 
         if not type_id:
             type_id = self.python_type_id(value)
@@ -218,20 +378,134 @@ class Encoder(object):
         res = encoder(value)
 
         if self.cache:
-            # add to cache
             if type_id == 1:
-                self.data_list.append(res)
-                self.data_pointer += len(res)
+                self.data += res
                 return res
+            if cache_key is None:
+                # the encoded value is the cache key: the items of a map or
+                # array are pointers, the key does not grow with the depth
+                cache_key = res
+                entry = self.data_cache.get(res)
+                if entry is not None:
+                    return self._hit(res, entry)
+            pointer = self._encode_pointer(len(self.data))
+            self.data += res
+            self.misses += 1
+            if self.cache_policy == "all" or not self._nested(value, type_id):
+                self._add(cache_key, pointer, len(res))
+            return pointer
+        return res
+
+
+class ShardEncoder(Encoder):
+    """
+    Encoder of a slice of the records in a worker process. The values are not
+    written with pointers: each distinct value of the slice gets a local id
+    (the order of encoding), a map or an array is kept as its header and the
+    ids of its items, the values encoded again are counted by id (uses).
+    Encoder.merge_shard writes the values of the shard into the data section.
+    """
+
+    def __init__(self):
+        super().__init__(cache=True)
+        self.chunks = []
+        self.counts = array("I")
+        self.refs = array("I")
+        self.uses = array("I")
+
+    def encode(self, value, type_id=None):
+        """Output: local id of the value"""
+        value_type = type(value)
+        ids = ()
+        if value_type is str or value_type is int:
+            local = self.data_cache.get(value)
+            if local is not None:
+                self.uses[local] += 1
+                return local
+            cache_key = value
+            res = self.type_decoder[self.python_type_id(value)](value)
+        else:
+            if value_type is dict:
+                encode = self.encode
+                ids = []
+                for k, v in value.items():
+                    ids.append(encode(k))
+                    ids.append(encode(v))
+                res = self._make_header(7, len(value))
+            elif value_type is list:
+                ids = [self.encode(v) for v in value]
+                res = self._make_header(11, len(value))
             else:
-                self.data_list.append(res)
-                pointer_position = self.data_pointer
-                self.data_pointer += len(res)
-                pointer = self._encode_pointer(pointer_position)
-                self.data_cache[cache_key] = pointer
-                return pointer
-        return res 
+                res = self.type_decoder[self.python_type_id(value)](value)
+            cache_key = res + array("I", ids).tobytes() if ids else res
+            local = self.data_cache.get(cache_key)
+            if local is not None:
+                self.uses[local] += 1
+                return local
+        local = len(self.chunks)
+        self.chunks.append(res)
+        self.counts.append(len(ids))
+        self.refs.extend(ids)
+        self.uses.append(0)
+        self.data_cache[cache_key] = local
+        return local
+
+    def shard(self, roots):
+        """
+        Input: local ids of the records encoded
+        Output: tuple of the encoded values (the header of a map or an
+                array), the number of items of each value, the local ids of
+                the items, the number of times each value was encoded again
+                and the local ids of the records
+        """
+        return self.chunks, self.counts, self.refs, self.uses, array("I", roots)
+
+
+def encode_shard(records):
+    """encode a slice of records in a worker process, see encode_records"""
+    shard = ShardEncoder()
+    return shard.shard([shard.encode(record) for record in records])
+
+
+def encode_records(encoder, records, workers=1):
+    """
+    Input: Encoder, list of the records and the number of processes
+    Output: list of the pointers returned by the encoder for each record
+    Workflow: The records are split into consecutive slices encoded by a pool
+              of worker processes (encode_shard), the shards are merged in the
+              order of the slices into the data section of the encoder. The
+              data section is deterministic, the same as encoding the records
+              one by one. A bounded cache (cache_size) or the policy leaf
+              encodes the records one by one whatever the workers.
+    """
+    if workers <= 1 or len(records) < 2 or not encoder.shardable:
+        return [encoder.encode(record) for record in records]
+    size = -(-len(records) // (workers * 4))
+    slices = [records[i : i + size] for i in range(0, len(records), size)]
+    pointers = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for shard in executor.map(encode_shard, slices):
+            pointers += encoder.merge_shard(*shard)
+    return pointers
 
 
 def bits_rstrip(n, length=None, keep=0):
     return map(int, bin(n)[2:].rjust(length, "0")[:keep])
+
+
+def pointer_value(res):
+    """
+    Decode a pointer returned by Encoder.encode into the offset of the data
+    it points to in the data section
+    """
+    size = len(res)
+    if size == 5:
+        return struct.unpack(">I", res[1:])[0]
+    pointer = int.from_bytes(res[1:], "big") | (res[0] & 0x07) << (8 * (size - 1))
+    if size == 4:
+        return pointer + 526336
+    if size == 3:
+        return pointer + 2048
+    if size == 2:
+        return pointer
+    raise ValueError("Invalid encoded pointer")
@@ -0,0 +1,478 @@
+#!/usr/bin/env python
+"""
+This module build the binary search tree of a mmdb file directly from
+(network, prefix length, record) tuples. The tree is kept in flat integer
+arrays instead of node objects and the search tree is serialized with
+24/28/32 bits records without going through netaddr IPSet/IPNetwork.
+"""
+import sys
+import time
+from array import array
+from collections.abc import Sequence
+from mmdb_encoder import Encoder, METADATA_MAGIC, encode_records, pointer_value
+
+# Size of the zero bytes separator between the search tree and data section
+DATA_SECTION_SEPARATOR_SIZE = 16
+# high and low nibble of the middle byte of a 28 bits node
+HIGH_NIBBLE = bytes(i >> 4 for i in range(256))
+LOW_NIBBLE = bytes(i & 0x0F for i in range(256))
+
+
+class TreeBuilder:
+    """
+    Binary trie of the mmdb search tree. Node 0 is the root, every node
+    has a left and right record stored in self._left and self._right:
+        record == 0 : empty record (no data)
+        record > 0  : index of the child node
+        record < 0  : leaf, index into self._records is -record - 1
+    The more specific prefix always wins whatever the order of insertion,
+    inserting a prefix already in the tree replace its record (last one
+    wins). Inserting from the least to the most specific prefix is the
+    fastest as no existing subtree needs to be filled.
+    With resolve, the records inserted are integer keys (uint32) kept in an
+    array and resolve(key) returns the record (dict) of a key when the data
+    section is encoded, the records are never all in memory at once.
+    """
+
+    def __init__(
+        self,
+        ip_version=6,
+        ipv4_compatible=True,
+        database_type="mrt2mmdb",
+        languages=None,
+        description="",
+        resolve=None,
+    ):
+        if ip_version not in (4, 6):
+            raise ValueError(f"ip_version should be 4 or 6, {ip_version} is incorrect")
+        if ip_version == 4 and ipv4_compatible:
+            raise ValueError("ipv4_compatible=True can set when ip_version=6")
+        self.ip_version = ip_version
+        self.ipv4_compatible = ipv4_compatible
+        self.database_type = database_type
+        self.languages = languages or []
+        self.description = {i: description for i in self.languages}
+        self._bit_length = 128 if ip_version == 6 else 32
+        self._left = array("i", [0])
+        self._right = array("i", [0])
+        self._resolve = resolve
+        self._records = [] if resolve is None else array("I")
+        # depth in the tree of the prefix of each record
+        self._depths = array("B")
+        # node of ::/96, start of the ipv4 compatible address space
+        self._ipv4_node = None
+
+    def __len__(self):
+        """number of records in the tree"""
+        return len(self._records)
+
+    def _get_ipv4_node(self):
+        """
+        Return the node of ::/96 to skip the walk over the 96 leading zero
+        bits for each of the ipv4 prefixes.
+        """
+        if self._ipv4_node is None:
+            self._ipv4_node = self._walk(0, 0, 96, 0)
+        return self._ipv4_node
+
+    def _walk(self, node, network, stop, shift):
+        """
+        Walk (and create) the nodes of the tree following the bits of
+        network until the depth of stop is reached. Shift is the number
+        of the bits already consumed by the caller. Leaf and empty records
+        on the path are split by copying them to both children.
+        """
+        left = self._left
+        right = self._right
+        for bit in range(self._bit_length - 1 - shift, self._bit_length - 1 - stop, -1):
+            side = right if (network >> bit) & 1 else left
+            child = side[node]
+            if child <= 0:
+                child = len(left)
+                left.append(side[node])
+                right.append(side[node])
+                side[node] = child
+            node = child
+        return node
+
+    def insert(self, network, prefixlen, record, version=None):
+        """
+        Input: network as integer, the prefix length and the record (dict) of the
+               prefix. version is the ip version of the network (default: the
+               ip version of the tree). Ipv4 networks are mapped into ::/96 in
+               a ipv6 tree.
+        Output: None. The record is attached to the leaf of the prefix
+        """
+        version = version or self.ip_version
+        if version == 6 and self.ip_version == 4:
+            raise ValueError("You inserted a IPv6 network to an IPv4-only database.")
+        if version == 4 and self.ip_version == 6 and not self.ipv4_compatible:
+            raise ValueError("You inserted a IPv4 network to an IPv6 database.")
+        if version == 4 and self.ip_version == 6 and prefixlen > 0:
+            start, shift = self._get_ipv4_node(), 96
+        else:
+            if version == 4 and self.ip_version == 6:
+                # 0.0.0.0/0 is the record of ::/96 itself
+                prefixlen = 96
+            start, shift = 0, 0
+        depth = shift + prefixlen
+        if depth == 0:
+            node, side = 0, (self._left, self._right)
+        else:
+            node = self._walk(start, network, depth - 1, shift)
+            bit = (network >> (self._bit_length - depth)) & 1
+            side = (self._right if bit else self._left,)
+        leaf = 0
+        for records in side:
+            child = records[node]
+            if child < 0 and self._depths[-child - 1] == depth:
+                # same prefix inserted again
+                self._records[-child - 1] = record
+                continue
+            if not leaf:
+                self._records.append(record)
+                self._depths.append(depth)
+                leaf = -len(self._records)
+            if child > 0:
+                self._fill(child, leaf, depth)
+            else:
+                records[node] = leaf
+
+    def _fill(self, node, leaf, depth):
+        """
+        Set leaf on the empty records and on the records of less specific (or
+        same) prefix than depth in the subtree of node. Records of the more
+        specific prefixes inserted before are kept.
+        """
+        depths = self._depths
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for records in (self._left, self._right):
+                child = records[node]
+                if child > 0:
+                    stack.append(child)
+                elif child == 0 or depths[-child - 1] <= depth:
+                    records[node] = leaf
+
+    def _number_nodes(self):
+        """
+        Number the nodes reachable from the root in depth first order.
+        Output: list of the reachable nodes and the mapping node -> new index
+        """
+        left = self._left
+        right = self._right
+        order = array("I")
+        index = array("I", [0]) * len(left)
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            index[node] = len(order)
+            order.append(node)
+            if right[node] > 0:
+                stack.append(right[node])
+            if left[node] > 0:
+                stack.append(left[node])
+        return order, index
+
+    def _encode_records(self, order, encoder, workers=1):
+        """
+        Encode the records of the leaves in depth first order into the data
+        section, by a pool of worker processes if workers > 1 (encode_records).
+        Output: array of the offset in the data section of each record (index
+                -leaf - 1), the records not reachable from the root are 0
+        """
+        # index of the records in the order of their first leaf
+        seen = bytearray(len(self._records))
+        leaves = array("I")
+        for node in order:
+            for child in (self._left[node], self._right[node]):
+                if child < 0 and not seen[-child - 1]:
+                    seen[-child - 1] = 1
+                    leaves.append(-child - 1)
+        del seen
+        if self._resolve is None:
+            records = [self._records[i] for i in leaves]
+        else:
+            records = ResolvedRecords(
+                array("I", (self._records[i] for i in leaves)), self._resolve
+            )
+        offsets = array("I", [0]) * len(self._records)
+        for i, pointer in zip(leaves, encode_records(encoder, records, workers)):
+            offsets[i] = pointer_value(pointer)
+        return offsets
+
+    @staticmethod
+    def record_size(max_record):
+        """return the smallest record size able to hold max_record"""
+        bit_count = max_record.bit_length()
+        if bit_count <= 24:
+            return 24
+        if bit_count <= 28:
+            return 28
+        if bit_count <= 32:
+            return 32
+        raise ValueError("record_size > 32")
+
+    def _build_meta(self, node_count, record_size):
+        return {
+            "node_count": node_count,
+            "record_size": record_size,
+            "ip_version": self.ip_version,
+            "database_type": self.database_type,
+            "languages": self.languages,
+            "binary_format_major_version": 2,
+            "binary_format_minor_version": 0,
+            "build_epoch": int(time.time()),
+            "description": self.description,
+        }
+
+    def to_db_file(self, fname, cache_size=0, cache_policy="all", workers=1):
+        """
+        Serialize the search tree, the data section and the metadata into
+        the mmdb file fname, the data section is encoded with the size and
+        policy of cache given by workers processes. Output: cache statistics
+        of the encoder
+        """
+        encoder = Encoder(cache=True, cache_size=cache_size, cache_policy=cache_policy)
+        order, index = self._number_nodes()
+        offsets = self._encode_records(order, encoder, workers)
+        node_count = len(order)
+        data_base = node_count + DATA_SECTION_SEPARATOR_SIZE
+        record_size = self.record_size(data_base + encoder.data_pointer)
+
+        # leaf and empty records are resolved to the data section and node_count
+        records = array("I")
+        append = records.append
+        for node in order:
+            for child in (self._left[node], self._right[node]):
+                if child > 0:
+                    append(index[child])
+                elif child < 0:
+                    append(data_base + offsets[-child - 1])
+                else:
+                    append(node_count)
+        with open(fname, "wb") as fh:
+            fh.write(pack_nodes(records, record_size))
+            fh.write(b"\x00" * DATA_SECTION_SEPARATOR_SIZE)
+            fh.write(encoder.data)
+            fh.write(METADATA_MAGIC)
+            fh.write(
+                Encoder(cache=False).encode_meta(
+                    self._build_meta(node_count, record_size)
+                )
+            )
+        return encoder.cache_stats()
+
+
+class ResolvedRecords(Sequence):
+    """
+    Read only sequence of the records of integer keys, each record is made by
+    resolve(key) when it is read (see TreeBuilder resolve)
+    """
+
+    def __init__(self, keys, resolve):
+        self._keys = keys
+        self._resolve = resolve
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._resolve(key) for key in self._keys[index]]
+        return self._resolve(self._keys[index])
+
+    def __len__(self):
+        return len(self._keys)
+
+
+def pack_nodes(records, record_size):
+    """
+    Input: flat list of the left/right records of all nodes and the record size
+    Output: bytes of the search tree with 24, 28 or 32 bits records
+    """
+    packed = array("I", records)
+    if sys.byteorder == "little":
+        packed.byteswap()
+    packed = packed.tobytes()
+    if record_size == 32:
+        return packed
+    res = bytearray(len(records) * record_size // 8)
+    if record_size == 24:
+        for i in range(3):
+            res[i::3] = packed[i + 1 :: 4]
+        return bytes(res)
+    if record_size == 28:
+        for i in range(3):
+            res[i::7] = packed[i + 1 :: 8]
+            res[i + 4 :: 7] = packed[i + 5 :: 8]
+        res[3::7] = bytes(
+            map(lambda l, r: (l & 0x0F) << 4 | (r & 0x0F), packed[0::8], packed[4::8])
+        )
+        return bytes(res)
+    raise ValueError(f"Unknown record size: {record_size}")
+
+
+def unpack_nodes(buf, record_size):
+    """
+    Input: bytes of the search tree with 24, 28 or 32 bits records
+    Output: flat array of the left/right records of all nodes (pack_nodes reversed)
+    """
+    if record_size == 32:
+        res = bytes(buf)
+    elif record_size == 24:
+        res = bytearray(len(buf) // 3 * 4)
+        for i in range(3):
+            res[i + 1 :: 4] = buf[i::3]
+    elif record_size == 28:
+        res = bytearray(len(buf) // 7 * 8)
+        for i in range(3):
+            res[i + 1 :: 8] = buf[i::7]
+            res[i + 5 :: 8] = buf[i + 4 :: 7]
+        res[0::8] = buf[3::7].translate(HIGH_NIBBLE)
+        res[4::8] = buf[3::7].translate(LOW_NIBBLE)
+    else:
+        raise ValueError(f"Unknown record size: {record_size}")
+    records = array("I", res)
+    if sys.byteorder == "little":
+        records.byteswap()
+    return records
+
+
+def data_records(reader):
+    """
+    Input: maxminddb.reader.Reader (pure python reader) of a mmdb file
+    Output: Tuple of the number of networks with a data record and the generator
+            of the distinct data records of the search tree. The search tree is
+            unpacked at once and each data record is decoded once, instead of
+            once for each of the networks pointing to it.
+    """
+    # pylint: disable=protected-access
+    meta = reader.metadata()
+    node_count = meta.node_count
+    records = unpack_nodes(reader._buffer[: meta.search_tree_size], meta.record_size)
+    # records above node_count point to the data section
+    leaves = list(filter(node_count.__lt__, records))
+    return len(leaves), map(reader._resolve_data_pointer, sorted(set(leaves)))
+
+
+def data_networks(reader):
+    """
+    Input: maxminddb.reader.Reader (pure python reader) of a mmdb file
+    Output: generator of (network (int), prefix length, ip version, pointer) of
+            the networks with a data record, in the order of the iteration of
+            the reader. The search tree is unpacked at once and the data
+            records are not decoded, the pointer identify the record.
+    """
+    # pylint: disable=protected-access
+    meta = reader.metadata()
+    node_count = meta.node_count
+    bits = 128 if meta.ip_version == 6 else 32
+    records = unpack_nodes(reader._buffer[: meta.search_tree_size], meta.record_size)
+    ipv4_start = reader._ipv4_start
+    # depth first, the right child is pushed first to walk the left one first
+    stack = [(0, 0, 0)]
+    while stack:
+        node, depth, network = stack.pop()
+        if network and node == ipv4_start:
+            # ipv4 aliases (eg. ::ffff:0:0/96) of the ipv4 subtree
+            continue
+        if node < node_count:
+            depth += 1
+            network <<= 1
+            stack.append((records[2 * node + 1], depth, network | 1))
+            stack.append((records[2 * node], depth, network))
+        elif node > node_count:
+            network <<= bits - depth
+            if bits == 128 and depth >= 96 and network <= 0xFFFFFFFF:
+                yield network, depth - 96, 4, node
+            else:
+                yield network, depth, 6 if bits == 128 else 4, node
+
+
+def leaf_records(reader):
+    """
+    Input: maxminddb.reader.Reader (pure python reader) of a mmdb file
+    Output: Tuple of the flat array of the left/right records of the search
+            tree and the generator of the index (2 * node + side) of each
+            record pointing to the data section, in the order of the iteration
+            of the reader. The ipv4 aliases are walked once like data_networks.
+    """
+    # pylint: disable=protected-access
+    meta = reader.metadata()
+    node_count = meta.node_count
+    records = unpack_nodes(reader._buffer[: meta.search_tree_size], meta.record_size)
+    ipv4_start = reader._ipv4_start
+
+    def walk():
+        # stack of (record index, all the bits of the path are zero)
+        stack = [(1, True), (0, True)]
+        while stack:
+            index, zero = stack.pop()
+            node = records[index]
+            if node > node_count:
+                yield index
+            elif node < node_count and not (node == ipv4_start and not zero):
+                stack.append((2 * node + 1, False))
+                stack.append((2 * node, zero))
+
+    return records, walk()
+
+
+def merge_nodes(records, node_count):
+    """
+    Input: flat array of the left/right records of a search tree and its node
+           count, records above node_count point to the data section
+    Output: Tuple of the flat list of the records of the merged search tree
+            and its node count
+    Workflow: A node whose two records point to the same data record (or are
+              both empty) is replaced by this record in its parent, from the
+              deepest nodes up. The nodes reachable from the root are numbered
+              again in depth first order like TreeBuilder, the unreachable
+              nodes are dropped and the data records are rebased on the new
+              node count. A node shared by many parents (the ipv4 subtree of
+              an ipv6 tree) is kept once.
+    """
+    # merged[node]: the node itself when kept, else -1 - (record - node_count)
+    merged = [None] * node_count
+
+    def resolve(child):
+        return merged[child] if child < node_count else node_count - child - 1
+
+    stack = [0]
+    while stack:
+        node = stack[-1]
+        if merged[node] is not None:
+            stack.pop()
+            continue
+        left, right = records[2 * node], records[2 * node + 1]
+        pending = [
+            child
+            for child in (right, left)
+            if child < node_count and merged[child] is None
+        ]
+        if pending:
+            stack += pending
+            continue
+        stack.pop()
+        left, right = resolve(left), resolve(right)
+        merged[node] = left if left == right and left < 0 and node else node
+    index = {}
+    order = []
+    stack = [0]
+    while stack:
+        node = stack.pop()
+        if node in index:
+            continue
+        index[node] = len(order)
+        order.append(node)
+        for child in (records[2 * node + 1], records[2 * node]):
+            child = resolve(child)
+            if child >= 0:
+                stack.append(child)
+    new_count = len(order)
+    res = []
+    append = res.append
+    for node in order:
+        for child in (records[2 * node], records[2 * node + 1]):
+            child = resolve(child)
+            append(index[child] if child >= 0 else new_count - child - 1)
+    return res, new_count
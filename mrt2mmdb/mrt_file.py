@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+"""
+This module deal with the mrt file itself. The MRT common header (RFC6396)
+of each entry gives the length of the entry, this allow the file to be split
+on entry boundaries without parsing the entries. Compressed mrt files are
+decompressed in the background while the entries are parsed.
+"""
+import bisect
+import bz2
+import collections
+import fcntl
+import gzip
+import io
+import itertools
+import mmap
+import os
+import re
+import struct
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# timestamp, type, subtype, length
+MRT_HEADER = struct.Struct(">IHHI")
+BZ2_MAGIC = b"BZh"
+GZIP_MAGIC = b"\x1f\x8b"
+# stream header followed by the magic of the first block
+BZ2_STREAM_MAGIC = re.compile(rb"BZh[1-9]1AY&SY")
+# minimum size of compressed data decompressed by a worker
+BZ2_RANGE_SIZE = 4 * 1024 * 1024
+PIPE_SIZE = 1024 * 1024
+
+
+def is_compressed(fname):
+    """return True if the mrt file is compressed with bzip2 or gzip"""
+    with open(fname, "rb") as fh:
+        hdr = fh.read(max(len(BZ2_MAGIC), len(GZIP_MAGIC)))
+    return hdr.startswith(BZ2_MAGIC) or hdr.startswith(GZIP_MAGIC)
+
+
+def mrt_offsets(fname, num_prefix=None):
+    """
+    Input: Filename of an uncompressed mrt file and the number of entries to
+           keep (default:all)
+    Output: List of the offsets of the beginning of each mrt entry followed by
+            the offset of the end of the last entry
+    """
+    offsets = [0]
+    with open(fname, "rb") as fh:
+        if fh.seek(0, 2) == 0:
+            return offsets
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            size = len(buf)
+            offset = 0
+            while offset + MRT_HEADER.size <= size:
+                if num_prefix is not None and len(offsets) > num_prefix:
+                    break
+                length = MRT_HEADER.unpack_from(buf, offset)[3]
+                offset = min(offset + MRT_HEADER.size + length, size)
+                offsets.append(offset)
+    return offsets
+
+
+def mrt_ranges(offsets, parts):
+    """
+    Input: Offsets of the mrt entries (from mrt_offsets) and the number of parts
+    Output: List of (start, end, entries) byte ranges of about the same size,
+            each range begins and ends on an entry boundary
+    """
+    ranges = []
+    total = offsets[-1]
+    first = 0
+    for part in range(1, parts + 1):
+        target = total * part // parts
+        last = min(bisect.bisect_left(offsets, target, first), len(offsets) - 1)
+        if last > first:
+            ranges.append((offsets[first], offsets[last], last - first))
+            first = last
+    return ranges
+
+
+def bz2_streams(fname):
+    """
+    Input: Filename of a bzip2 file
+    Output: Offsets of the beginning of each bzip2 stream followed by the size
+            of the file. Files written by parallel bzip2 tools (pbzip2, lbzip2)
+            hold many streams that can be decompressed independently.
+    """
+    with open(fname, "rb") as fh:
+        size = fh.seek(0, 2)
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            offsets = [m.start() for m in BZ2_STREAM_MAGIC.finditer(buf)]
+    if not offsets or offsets[0] != 0:
+        offsets.insert(0, 0)
+    return offsets + [size]
+
+
+def decompress_bz2_range(fname, start, end):
+    """
+    Decompress the bzip2 streams between the byte offsets start and end.
+    Return None if the range does not end on a stream boundary, ie. one of the
+    offsets found by bz2_streams was a false match inside compressed data.
+    """
+    with open(fname, "rb") as fh:
+        fh.seek(start)
+        data = fh.read(end - start)
+    result = []
+    while data:
+        decompressor = bz2.BZ2Decompressor()
+        try:
+            result.append(decompressor.decompress(data))
+        except OSError:
+            return None
+        if not decompressor.eof:
+            return None
+        data = decompressor.unused_data
+    return b"".join(result)
+
+
+def _feed_bz2_parallel(fname, out, workers, stop):
+    """
+    Decompress a multi-stream bzip2 file in a pool of processes and write the
+    result in file order to out. Fall back to a serial decompression from the
+    first range that could not be decompressed on its own.
+    """
+    offsets = bz2_streams(fname)
+    ranges = []
+    start = 0
+    for offset in offsets[1:]:
+        if offset - start >= BZ2_RANGE_SIZE or offset == offsets[-1]:
+            ranges.append((start, offset))
+            start = offset
+    if len(ranges) < 2:
+        # single stream bzip2 file, the whole file is decompressed serially
+        ranges = []
+    failed = 0 if not ranges else None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        ranges = iter(ranges)
+        while failed is None and not stop.is_set():
+            # keep the pool busy but bound the decompressed data waiting to be parsed
+            for start, end in itertools.islice(ranges, workers * 2 - len(pending)):
+                future = executor.submit(decompress_bz2_range, fname, start, end)
+                pending.append((start, future))
+            if not pending:
+                break
+            start, future = pending.popleft()
+            data = future.result()
+            if data is None:
+                failed = start
+            else:
+                out.write(data)
+        for _, future in pending:
+            future.cancel()
+    if failed is not None:
+        with open(fname, "rb") as fh:
+            fh.seek(failed)
+            with bz2.open(fh, "rb") as stream:
+                _copy(stream, out, stop)
+
+
+def _copy(stream, out, stop):
+    """copy stream to out until the end of stream or stop is set"""
+    while not stop.is_set():
+        data = stream.read(PIPE_SIZE)
+        if not data:
+            return
+        out.write(data)
+
+
+def _feed(fname, fd, workers, stop, errors):
+    """
+    Decompress the mrt file into the write end (fd) of a pipe. The error of the
+    decompression (eg. EOFError of a truncated file) is appended to errors.
+    """
+    try:
+        with os.fdopen(fd, "wb") as out:
+            with open(fname, "rb") as fh:
+                hdr = fh.read(len(BZ2_MAGIC))
+            if hdr.startswith(BZ2_MAGIC) and workers > 1:
+                _feed_bz2_parallel(fname, out, workers, stop)
+                return
+            opener = bz2.open if hdr.startswith(BZ2_MAGIC) else gzip.open
+            with opener(fname, "rb") as stream:
+                _copy(stream, out, stop)
+    except BrokenPipeError:
+        pass
+    except Exception as exc:  # pylint: disable=broad-exception-caught
+        errors.append(exc)
+
+
+class PipeReader(io.BufferedReader):
+    """
+    Read end of the pipe fed by the decompression thread. Closing the reader
+    before the end of the file (eg. --prefixes) stop the thread and drain the
+    pipe, a write into a closed pipe would raise SIGPIPE which is not ignored
+    once mrtparse is imported.
+    The end of the pipe is only the end of the file if the decompression
+    succeeded, otherwise the error of the thread is raised by read, or by close
+    if the reader is closed at the end of the pipe without reading it.
+    """
+
+    def __init__(self, fd, stop, thread, errors):
+        super().__init__(io.FileIO(fd, "rb"), PIPE_SIZE)
+        self.stop = stop
+        self.thread = thread
+        self.errors = errors
+
+    def _raise_error(self):
+        """wait for the end of the thread and raise its error, if any"""
+        self.thread.join()
+        if self.errors:
+            raise self.errors.pop()
+
+    def read(self, size=-1):
+        data = super().read(size)
+        if not data and size != 0:
+            self._raise_error()
+        return data
+
+    def close(self):
+        if self.closed:
+            return
+        self.stop.set()
+        early = bool(self.peek(1))
+        while self.raw.read(PIPE_SIZE):
+            early = True
+        super().close()
+        if early:
+            # the rest of the file is not read, nor its errors
+            self.thread.join()
+        else:
+            self._raise_error()
+
+
+def open_mrt(fname, workers=1):
+    """
+    Return a file object to read the mrt file. A compressed file is decompressed
+    by a background thread (and a pool of processes for multi-stream bzip2 when
+    workers > 1) that feeds a pipe, the decompression overlaps with the parsing
+    of the mrt entries and nothing is written to disk.
+    """
+    if not is_compressed(fname):
+        return open(fname, "rb")
+    read_fd, write_fd = os.pipe()
+    try:
+        fcntl.fcntl(write_fd, fcntl.F_SETPIPE_SZ, PIPE_SIZE)
+    except (AttributeError, OSError):
+        pass
+    stop = threading.Event()
+    errors = []
+    thread = threading.Thread(
+        target=_feed, args=(fname, write_fd, workers, stop, errors), daemon=True
+    )
+    thread.start()
+    return PipeReader(read_fd, stop, thread, errors)
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+"""
+This module is a minimal TABLE_DUMP_V2 decoder (RFC6396, RFC8050) for the
+mrt to mmdb conversion. Only the prefix and the AS_PATH of the first rib
+entry are decoded, the other path attributes are skipped using their length.
+The AS_PATH attribute is located by its type code.
+"""
+import itertools
+import mmap
+import socket
+import struct
+from mrt_file import MRT_HEADER, is_compressed, open_mrt
+
+TABLE_DUMP_V2 = 13
+PEER_INDEX_TABLE = 1
+# subtype -> (ip version, add-path)
+RIB_SUBTYPES = {
+    2: (4, False),  # RIB_IPV4_UNICAST
+    3: (4, False),  # RIB_IPV4_MULTICAST
+    4: (6, False),  # RIB_IPV6_UNICAST
+    5: (6, False),  # RIB_IPV6_MULTICAST
+    8: (4, True),  # RIB_IPV4_UNICAST_ADDPATH
+    9: (4, True),  # RIB_IPV4_MULTICAST_ADDPATH
+    10: (6, True),  # RIB_IPV6_UNICAST_ADDPATH
+    11: (6, True),  # RIB_IPV6_MULTICAST_ADDPATH
+}
+ATTR_AS_PATH = 2
+ATTR_FLAG_EXTENDED_LENGTH = 0x10
+
+
+def decode_aspath(buf, offset, end, asn_size=4):
+    """
+    Input: Buffer, the offsets of the value of the AS_PATH attribute and the
+           size of the ASN (4 bytes, or 2 bytes in some BGP4MP messages)
+    Output: AS_PATH as a list of ASN strings. Only the first two segments
+            (AS_SEQUENCE and the AS_SET that may follow) are kept like
+            make_dict. None if the AS_PATH has no segment.
+    """
+    aspath = None
+    segments = 0
+    fmt = "I" if asn_size == 4 else "H"
+    while offset < end and segments < 2:
+        count = buf[offset + 1]
+        asns = struct.unpack_from(f">{count}{fmt}", buf, offset + 2)
+        if aspath is None:
+            aspath = list(map(str, asns))
+        else:
+            aspath += map(str, asns)
+        offset += 2 + asn_size * count
+        segments += 1
+    return aspath
+
+
+def peer_key(asn, address):
+    """key of a BGP peer: "<peer AS> <peer IP>" """
+    family = socket.AF_INET if len(address) == 4 else socket.AF_INET6
+    return f"{asn} {socket.inet_ntop(family, bytes(address))}"
+
+
+def decode_peer_table(buf, offset):
+    """
+    Input: Buffer and offset of the body of the PEER_INDEX_TABLE mrt entry
+    Output: List of the keys of the peers (peer_key) in the order of their index
+    """
+    # collector BGP ID, view name
+    offset += 4
+    offset += 2 + struct.unpack_from(">H", buf, offset)[0]
+    count = struct.unpack_from(">H", buf, offset)[0]
+    offset += 2
+    peers = []
+    for _ in range(count):
+        peer_type = buf[offset]
+        # peer type, peer BGP ID
+        offset += 5
+        ip_size = 16 if peer_type & 1 else 4
+        address = buf[offset : offset + ip_size]
+        offset += ip_size
+        asn_size = 4 if peer_type & 2 else 2
+        asn = int.from_bytes(buf[offset : offset + asn_size], "big")
+        offset += asn_size
+        peers.append(peer_key(asn, address))
+    return peers
+
+
+def find_aspath(buf, offset, end):
+    """
+    Input: Buffer and offsets of the path attributes of a rib entry
+    Output: AS_PATH of the attributes (see decode_aspath), None if there is no
+            AS_PATH attribute
+    """
+    while offset < end:
+        flags, code = buf[offset], buf[offset + 1]
+        if flags & ATTR_FLAG_EXTENDED_LENGTH:
+            attr_len = struct.unpack_from(">H", buf, offset + 2)[0]
+            offset += 4
+        else:
+            attr_len = buf[offset + 2]
+            offset += 3
+        if code == ATTR_AS_PATH:
+            return decode_aspath(buf, offset, offset + attr_len)
+        offset += attr_len
+    return None
+
+
+def decode_prefix(buf, offset, subtype):
+    """
+    Input: Buffer, offset of the body of a RIB_IPV4/IPV6 mrt entry and its subtype
+    Output: Tuple of (network, prefix length, ip version, offset of the rib
+            entry count)
+    """
+    version = RIB_SUBTYPES[subtype][0]
+    length = buf[offset + 4]
+    size = (length + 7) // 8
+    offset += 5
+    network = int.from_bytes(buf[offset : offset + size], "big")
+    network <<= (32 if version == 4 else 128) - size * 8
+    return network, length, version, offset + size
+
+
+def decode_rib(buf, offset, subtype):
+    """
+    Input: Buffer, offset of the body of a RIB_IPV4/IPV6 mrt entry and its subtype
+    Output: Tuple of (network, prefix length, ip version, AS_PATH) of the first
+            rib entry. None if the entry has no rib entry or no AS_PATH.
+    """
+    network, length, version, offset = decode_prefix(buf, offset, subtype)
+    if struct.unpack_from(">H", buf, offset)[0] == 0:
+        return None
+    # peer index, originated time (and path identifier)
+    offset += 2 + 6 + (4 if RIB_SUBTYPES[subtype][1] else 0)
+    end = offset + 2 + struct.unpack_from(">H", buf, offset)[0]
+    aspath = find_aspath(buf, offset + 2, end)
+    if aspath is None:
+        return None
+    return network, length, version, aspath
+
+
+def decode_rib_routes(buf, offset, subtype):
+    """
+    Input: Buffer, offset of the body of a RIB_IPV4/IPV6 mrt entry and its subtype
+    Output: Generator of (network, prefix length, ip version, peer index,
+            AS_PATH) of every rib entry with an AS_PATH
+    """
+    network, length, version, offset = decode_prefix(buf, offset, subtype)
+    count = struct.unpack_from(">H", buf, offset)[0]
+    offset += 2
+    add_path = RIB_SUBTYPES[subtype][1]
+    for _ in range(count):
+        peer_index = struct.unpack_from(">H", buf, offset)[0]
+        # peer index, originated time (and path identifier)
+        offset += 2 + 4 + (4 if add_path else 0)
+        end = offset + 2 + struct.unpack_from(">H", buf, offset)[0]
+        aspath = find_aspath(buf, offset + 2, end)
+        if aspath is not None:
+            yield network, length, version, peer_index, aspath
+        offset = end
+
+
+def mrt_entries(buf, num_prefix=None, start=0, end=None):
+    """
+    Generator of the (type, subtype, buffer, offset of the body) of the mrt
+    entries in the buffer between the byte offsets start and end.
+    """
+    end = len(buf) if end is None else end
+    offset = start
+    count = 0
+    while offset + MRT_HEADER.size <= end:
+        if num_prefix is not None and count >= num_prefix:
+            return
+        _, mrt_type, subtype, length = MRT_HEADER.unpack_from(buf, offset)
+        yield mrt_type, subtype, buf, offset + MRT_HEADER.size
+        offset += MRT_HEADER.size + length
+        count += 1
+
+
+def stream_entries(fh, num_prefix=None):
+    """
+    Generator of the (type, subtype, body, 0) of the mrt entries read from the
+    file object fh. Used for compressed mrt files that cannot be mmap'd.
+    """
+    for _ in itertools.islice(itertools.count(), num_prefix):
+        header = fh.read(MRT_HEADER.size)
+        if len(header) < MRT_HEADER.size:
+            return
+        _, mrt_type, subtype, length = MRT_HEADER.unpack(header)
+        yield mrt_type, subtype, fh.read(length), 0
+
+
+def decode_entries(entries):
+    """
+    Generator of (network, prefix length, ip version, AS_PATH) of each mrt
+    entry given by mrt_entries or stream_entries. None is generated for the
+    mrt entries without AS_PATH and the other mrt types.
+    """
+    for mrt_type, subtype, buf, offset in entries:
+        if mrt_type == TABLE_DUMP_V2 and subtype in RIB_SUBTYPES:
+            yield decode_rib(buf, offset, subtype)
+        else:
+            yield None
+
+
+def read_entries(fname, num_prefix=None, start=0, end=None, workers=1):
+    """
+    Generator of the mrt entries of the mrt file (see mrt_entries). Uncompressed
+    files are mmap'd and can be limited to the byte range start-end, compressed
+    files are decompressed in the background by open_mrt.
+    """
+    if is_compressed(fname):
+        with open_mrt(fname, workers) as stream:
+            yield from stream_entries(stream, num_prefix)
+        return
+    with open(fname, "rb") as fh:
+        if fh.seek(0, 2) == 0:
+            return
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            yield from mrt_entries(buf, num_prefix, start, end)
+
+
+def iter_native(fname, num_prefix=None, start=0, end=None, workers=1):
+    """
+    Generator of (network, prefix length, ip version, AS_PATH) of each mrt
+    entry of the mrt file, see decode_entries and read_entries.
+    """
+    yield from decode_entries(read_entries(fname, num_prefix, start, end, workers))
+
+
+def iter_rib_routes(fname, num_prefix=None, workers=1):
+    """
+    Generator of (network, prefix length, ip version, peer, AS_PATH) of every
+    rib entry of the mrt file, not only the first one of each prefix. The peer
+    is the key (peer_key) of the peer in the PEER_INDEX_TABLE, "peer <index>"
+    when the mrt file has no PEER_INDEX_TABLE. The peers of the
+    PEER_INDEX_TABLE are generated first, in the order of their index, as
+    (None, None, None, peer, None).
+    """
+    peers = []
+    for mrt_type, subtype, buf, offset in read_entries(
+        fname, num_prefix, workers=workers
+    ):
+        if mrt_type != TABLE_DUMP_V2:
+            continue
+        if subtype == PEER_INDEX_TABLE:
+            peers = decode_peer_table(buf, offset)
+            for peer in peers:
+                yield None, None, None, peer, None
+        elif subtype in RIB_SUBTYPES:
+            for network, length, version, index, aspath in decode_rib_routes(
+                buf, offset, subtype
+            ):
+                peer = peers[index] if index < len(peers) else f"peer {index}"
+                yield network, length, version, peer, aspath
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""
+This module is a minimal BGP4MP decoder (RFC6396, RFC8050) of the BGP UPDATE
+messages of a mrt update dump. Only the peer, the announced and withdrawn
+prefixes and the AS_PATH (merged with AS4_PATH, RFC6793) of each UPDATE are
+decoded, the other path attributes and the other BGP messages are skipped.
+"""
+import mmap
+import struct
+from mrt_file import MRT_HEADER, is_compressed, open_mrt
+from mrt_native import decode_aspath, mrt_entries, peer_key, stream_entries
+
+BGP4MP = 16
+BGP4MP_ET = 17
+# subtype -> (size of the ASN of the peer header, add-path)
+MESSAGE_SUBTYPES = {
+    1: (2, False),  # BGP4MP_MESSAGE
+    4: (4, False),  # BGP4MP_MESSAGE_AS4
+    6: (2, False),  # BGP4MP_MESSAGE_LOCAL
+    7: (4, False),  # BGP4MP_MESSAGE_AS4_LOCAL
+    8: (2, True),  # BGP4MP_MESSAGE_ADDPATH
+    9: (4, True),  # BGP4MP_MESSAGE_AS4_ADDPATH
+    10: (2, True),  # BGP4MP_MESSAGE_LOCAL_ADDPATH
+    11: (4, True),  # BGP4MP_MESSAGE_AS4_LOCAL_ADDPATH
+}
+AFI_VERSION = {1: 4, 2: 6}
+# unicast and multicast, like the RIB subtypes of the native decoder
+SAFI = (1, 2)
+BGP_UPDATE = 2
+# marker, length and type of the BGP message header
+BGP_HEADER_SIZE = 19
+ATTR_AS_PATH = 2
+ATTR_MP_REACH_NLRI = 14
+ATTR_MP_UNREACH_NLRI = 15
+ATTR_AS4_PATH = 17
+ATTR_FLAG_EXTENDED_LENGTH = 0x10
+
+
+def decode_prefixes(buf, offset, end, version, add_path):
+    """
+    Input: Buffer, offsets of a list of prefixes (NLRI or withdrawn routes), ip
+           version and add-path of the prefixes
+    Output: list of (network, prefix length, ip version)
+    """
+    bits = 32 if version == 4 else 128
+    prefixes = []
+    while offset < end:
+        if add_path:
+            offset += 4
+        length = buf[offset]
+        size = (length + 7) // 8
+        network = int.from_bytes(buf[offset + 1 : offset + 1 + size], "big")
+        prefixes.append((network << (bits - size * 8), length, version))
+        offset += 1 + size
+    return prefixes
+
+
+def merge_as4_path(aspath, as4_path):
+    """
+    Input: AS_PATH of 2 bytes ASN and AS4_PATH (RFC6793)
+    Output: AS_PATH with the trailing ASN replaced by the AS4_PATH
+    """
+    if as4_path is None or aspath is None or len(as4_path) > len(aspath):
+        return aspath
+    return aspath[: len(aspath) - len(as4_path)] + as4_path
+
+
+def decode_update(buf, offset, end, asn_size, add_path):
+    """
+    Input: Buffer, offsets of the body of a BGP UPDATE message, size of the ASN
+           of the AS_PATH and add-path of the prefixes
+    Output: Generator of (network, prefix length, ip version, AS_PATH), the
+            AS_PATH is None for the withdrawn prefixes
+    """
+    withdrawn_len = struct.unpack_from(">H", buf, offset)[0]
+    offset += 2
+    withdrawn = decode_prefixes(buf, offset, offset + withdrawn_len, 4, add_path)
+    offset += withdrawn_len
+    attr_end = offset + 2 + struct.unpack_from(">H", buf, offset)[0]
+    offset += 2
+    aspath = as4_path = None
+    announced = []
+    while offset < attr_end:
+        flags, code = buf[offset], buf[offset + 1]
+        if flags & ATTR_FLAG_EXTENDED_LENGTH:
+            attr_len = struct.unpack_from(">H", buf, offset + 2)[0]
+            offset += 4
+        else:
+            attr_len = buf[offset + 2]
+            offset += 3
+        if code == ATTR_AS_PATH:
+            aspath = decode_aspath(buf, offset, offset + attr_len, asn_size)
+        elif code == ATTR_AS4_PATH:
+            as4_path = decode_aspath(buf, offset, offset + attr_len)
+        elif code in (ATTR_MP_REACH_NLRI, ATTR_MP_UNREACH_NLRI):
+            afi, safi = struct.unpack_from(">HB", buf, offset)
+            start = offset + 3
+            if code == ATTR_MP_REACH_NLRI:
+                # next hop and reserved byte
+                start += 1 + buf[start] + 1
+            if afi in AFI_VERSION and safi in SAFI:
+                prefixes = decode_prefixes(
+                    buf, start, offset + attr_len, AFI_VERSION[afi], add_path
+                )
+                if code == ATTR_MP_REACH_NLRI:
+                    announced += prefixes
+                else:
+                    withdrawn += prefixes
+        offset += attr_len
+    announced += decode_prefixes(buf, attr_end, end, 4, add_path)
+    for prefix in withdrawn:
+        yield (*prefix, None)
+    if asn_size == 2:
+        aspath = merge_as4_path(aspath, as4_path)
+    if aspath is None:
+        # announcements without AS_PATH are skipped like the rib entries
+        return
+    for prefix in announced:
+        yield (*prefix, aspath)
+
+
+def decode_message(buf, offset, end, mrt_type, subtype):
+    """
+    Input: Buffer, offsets of the body of a BGP4MP(_ET) mrt entry, its type and
+           subtype
+    Output: Generator of (network, prefix length, ip version, AS_PATH, peer) of
+            the UPDATE message, nothing for the other BGP messages. The peer is
+            the key of the peer AS and peer IP (mrt_native.peer_key).
+    """
+    asn_size, add_path = MESSAGE_SUBTYPES[subtype]
+    if mrt_type == BGP4MP_ET:
+        offset += 4
+    peer_as = int.from_bytes(buf[offset : offset + asn_size], "big")
+    # peer AS, local AS, interface index, AFI
+    offset += 2 * asn_size + 2
+    afi = struct.unpack_from(">H", buf, offset)[0]
+    ip_size = 4 if afi == 1 else 16
+    peer = peer_key(peer_as, buf[offset + 2 : offset + 2 + ip_size])
+    # peer IP and local IP
+    offset += 2 + 2 * ip_size
+    if buf[offset + BGP_HEADER_SIZE - 1] != BGP_UPDATE:
+        return
+    end = min(end, offset + struct.unpack_from(">H", buf, offset + 16)[0])
+    for prefix in decode_update(
+        buf, offset + BGP_HEADER_SIZE, end, asn_size, add_path
+    ):
+        yield (*prefix, peer)
+
+
+def decode_updates(entries):
+    """
+    Generator of (network, prefix length, ip version, AS_PATH, peer) of the BGP
+    UPDATE messages of the mrt entries given by mrt_entries or stream_entries,
+    in the order of the file. The AS_PATH is None for a withdrawn prefix.
+    """
+    for mrt_type, subtype, buf, offset in entries:
+        if mrt_type in (BGP4MP, BGP4MP_ET) and subtype in MESSAGE_SUBTYPES:
+            if offset:
+                end = offset + MRT_HEADER.unpack_from(buf, offset - MRT_HEADER.size)[3]
+            else:
+                # body read by stream_entries
+                end = len(buf)
+            yield from decode_message(buf, offset, end, mrt_type, subtype)
+
+
+def iter_updates(fname, workers=1):
+    """
+    Generator of the announced and withdrawn prefixes of the mrt update file,
+    see decode_updates. Compressed files are decompressed in the background
+    by open_mrt.
+    """
+    if is_compressed(fname):
+        with open_mrt(fname, workers) as stream:
+            yield from decode_updates(stream_entries(stream))
+        return
+    with open(fname, "rb") as fh:
+        if fh.seek(0, 2) == 0:
+            return
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            yield from decode_updates(mrt_entries(buf))
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+"""
+This module keep the prefixes loaded from the mrt file bucketed by ip version
+and prefix length. The buckets are walked from the least to the most specific
+prefix when the mmdb search tree is built, no sorting of the prefixes and no
+netaddr object is needed.
+"""
+import socket
+from array import array
+
+# Number of bits of the ip version
+BITS = {4: 32, 6: 128}
+FAMILY = {4: socket.AF_INET, 6: socket.AF_INET6}
+LOW_MASK = (1 << 64) - 1
+# AS_PATH id of a removed prefix
+DELETED = 0xFFFFFFFF
+
+
+def parse_prefix(prefix):
+    """
+    Input: prefix string eg. 1.0.0.0/24 or 2001:db8::/32
+    Output: tuple of network (int), prefix length and ip version
+    """
+    address, length = prefix.split("/")
+    version = 6 if ":" in address else 4
+    network = int.from_bytes(socket.inet_pton(FAMILY[version], address), "big")
+    return network, int(length), version
+
+
+def format_prefix(network, length, version):
+    """
+    Input: network (int), prefix length and ip version
+    Output: prefix string eg. 1.0.0.0/24 or 2001:db8::/32
+    """
+    address = socket.inet_ntop(
+        FAMILY[version], network.to_bytes(BITS[version] // 8, "big")
+    )
+    return f"{address}/{length}"
+
+
+class PathTable:
+    """
+    Table of the distinct AS_PATH. Each AS_PATH is kept once as a tuple and
+    numbered in the order it is first seen, the prefixes sharing an AS_PATH
+    share its id.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._paths = []
+
+    def intern(self, aspath):
+        """return the id of the AS_PATH, added to the table if it is new"""
+        key = tuple(aspath)
+        path_id = self._ids.get(key)
+        if path_id is None:
+            path_id = self._ids[key] = len(self._paths)
+            self._paths.append(key)
+        return path_id
+
+    def __getitem__(self, path_id):
+        return self._paths[path_id]
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __iter__(self):
+        return iter(self._paths)
+
+
+class Bucket:
+    """
+    Prefixes of one prefix length of one ip version in array columns: the
+    network (ipv4: uint32, ipv6: high and low uint64) and the id of the
+    AS_PATH (uint32). Prefixes are appended, a prefix appended again or
+    removed (DELETED id) is resolved by compact() before the bucket is read:
+    the prefix keeps the position of its first insertion and its last id
+    (last one wins).
+    """
+
+    __slots__ = ("version", "high", "low", "path_ids", "_compacted")
+
+    def __init__(self, version):
+        self.version = version
+        self.high = array("I" if version == 4 else "Q")
+        self.low = None if version == 4 else array("Q")
+        self.path_ids = array("I")
+        self._compacted = 0
+
+    def append(self, network, path_id):
+        """add or replace the AS_PATH id of a network"""
+        if self.low is None:
+            self.high.append(network)
+        else:
+            self.high.append(network >> 64)
+            self.low.append(network & LOW_MASK)
+        self.path_ids.append(path_id)
+
+    def extend(self, networks, path_ids):
+        """append the networks (int) with their AS_PATH id"""
+        if self.low is None:
+            self.high.extend(networks)
+        else:
+            for network in networks:
+                self.high.append(network >> 64)
+                self.low.append(network & LOW_MASK)
+        self.path_ids.extend(path_ids)
+
+    def networks(self):
+        """networks (int) of the bucket, in the order of the columns"""
+        if self.low is None:
+            return self.high
+        return [high << 64 | low for high, low in zip(self.high, self.low)]
+
+    def compact(self):
+        """remove the prefixes replaced or removed"""
+        if len(self.path_ids) == self._compacted:
+            return
+        networks = self.networks()
+        # a set is smaller than the dict needed to resolve the duplicates
+        if DELETED in self.path_ids or len(set(networks)) < len(networks):
+            latest = dict(zip(networks, self.path_ids))
+            self.high = array(self.high.typecode)
+            self.low = None if self.low is None else array("Q")
+            self.path_ids = array("I")
+            self.extend(
+                [n for n, i in latest.items() if i != DELETED],
+                [i for i in latest.values() if i != DELETED],
+            )
+        self._compacted = len(self.path_ids)
+
+    def __len__(self):
+        self.compact()
+        return len(self.path_ids)
+
+    def items(self):
+        """(network, AS_PATH id) of the prefixes of the bucket"""
+        self.compact()
+        return zip(self.networks(), self.path_ids)
+
+
+class PrefixTable:
+    """
+    Table of prefix -> AS_PATH. Each prefix length of each ip version has its
+    own Bucket (33 ipv4 and 129 ipv6 buckets) holding the network and the id
+    of the AS_PATH in the PathTable of the table (self.paths) in arrays.
+    Setting a prefix already in the table replace the AS_PATH (last one wins).
+    Several tables can share one PathTable (paths).
+    """
+
+    def __init__(self, paths=None):
+        self._buckets = {
+            version: [Bucket(version) for _ in range(bits + 1)]
+            for version, bits in BITS.items()
+        }
+        self.paths = PathTable() if paths is None else paths
+
+    def __setitem__(self, prefix, aspath):
+        network, length, version = parse_prefix(prefix)
+        self._buckets[version][length].append(network, self.paths.intern(aspath))
+
+    def add(self, network, length, version, aspath):
+        """add a prefix given as network (int), prefix length and ip version"""
+        self._buckets[version][length].append(network, self.paths.intern(aspath))
+
+    def update_bucket(self, version, length, networks, path_ids):
+        """add the networks of a bucket with the id of their AS_PATH in self.paths"""
+        self._buckets[version][length].extend(networks, path_ids)
+
+    def discard(self, network, length, version):
+        """remove a prefix given as network (int), prefix length and ip version"""
+        self._buckets[version][length].append(network, DELETED)
+
+    def update(self, other):
+        """merge another PrefixTable into this table, the other table wins"""
+        if other.paths is self.paths:
+            path_ids = None
+        else:
+            path_ids = [self.paths.intern(aspath) for aspath in other.paths]
+        for version, buckets in other._buckets.items():
+            for length, bucket in enumerate(buckets):
+                if len(bucket):
+                    self._buckets[version][length].extend(
+                        bucket.networks(),
+                        (
+                            bucket.path_ids
+                            if path_ids is None
+                            else map(path_ids.__getitem__, bucket.path_ids)
+                        ),
+                    )
+
+    def compact(self):
+        """resolve the prefixes replaced or removed in every bucket"""
+        for buckets in self._buckets.values():
+            for bucket in buckets:
+                bucket.compact()
+
+    def __len__(self):
+        return sum(len(b) for buckets in self._buckets.values() for b in buckets)
+
+    def entries(self):
+        """
+        Output: generator of (network, length, version, id of the AS_PATH) from
+                the least to the most specific prefix. Ipv4 prefixes are walked
+                at the depth they have in a ipv6 tree (::/96 mapping), ie.
+                1.0.0.0/24 after ::/119 and before ::/121
+        """
+        ipv4 = self._buckets[4]
+        ipv6 = self._buckets[6]
+        for depth in range(BITS[6] + 1):
+            for network, path_id in ipv6[depth].items():
+                yield network, depth, 6, path_id
+            if depth >= 96:
+                for network, path_id in ipv4[depth - 96].items():
+                    yield network, depth - 96, 4, path_id
+
+    def items(self):
+        """
+        Output: generator of (network, length, version, aspath) in the order of
+                entries(), the AS_PATH is the tuple of the PathTable
+        """
+        paths = self.paths
+        for network, length, version, path_id in self.entries():
+            yield network, length, version, paths[path_id]
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+"""
+This module save the PrefixTable parsed from a mrt file into a snapshot file
+next to the mrt file (<mrt>.ribsnap). The next conversions of the same mrt
+file mmap the snapshot instead of parsing the mrt file again. The snapshot is
+keyed by the path, size and mtime of the mrt file and the number of entries
+parsed (--prefixes) and the parser (--parser), a new mrt file is detected and
+parsed again.
+
+File layout (little endian):
+    magic, length of the json meta
+    json meta (source of the snapshot, count of mrt entries, runs of prefixes)
+    ipv4 networks  : number of ipv4 prefixes * uint32
+    ipv6 networks  : number of ipv6 prefixes * 2 * uint64 (high, low)
+    AS_PATH ids    : number of prefixes * uint32
+    AS_PATH sizes  : number of AS_PATH * uint32 (number of ASN of the AS_PATH)
+    AS_PATH table  : ASN of all the AS_PATH joined by newlines
+The prefixes are in the order of PrefixTable.items(), the runs of the meta
+give the ip version, prefix length and number of prefixes of each bucket.
+The same layout holds several PrefixTable sharing one PathTable (write_tables,
+read_tables), the prefixes of the tables follow each other and the meta has
+the runs of each table.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from prefix_table import PrefixTable
+
+SNAPSHOT_SUFFIX = ".ribsnap"
+MAGIC = b"MRT2MMDB-RIBSNAP"
+# version of the layout, the files of another layout are parsed again
+LAYOUT = 2
+HEADER = struct.Struct("<16sI4x")
+
+
+def snapshot_filename(fname):
+    """return the filename of the snapshot of the mrt file"""
+    return fname + SNAPSHOT_SUFFIX
+
+
+def source_key(fname, num_prefix=None, parser=None):
+    """
+    Input: Filename of the mrt file, the number of entries parsed and the
+           parser (--parser)
+    Output: dict identifying the parsed mrt file, the snapshot is valid while
+            the key is the same
+    """
+    stat = os.stat(fname)
+    return {
+        "path": os.path.abspath(fname),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "prefixes": num_prefix,
+        "parser": parser,
+    }
+
+
+def _padded(values):
+    """bytes of the array in little endian padded to a multiple of 8 bytes"""
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    data = values.tobytes()
+    return data + bytes(-len(data) % 8)
+
+
+def write_tables(target, tables, meta):
+    """
+    Input: Filename of the file, list of PrefixTable sharing the PathTable of
+           the first table and the json meta of the file
+    Output: True if the file was written (atomically)
+    """
+    ipv4 = array("I")
+    ipv6 = array("Q")
+    ids = array("I")
+    runs = []
+    for table in tables:
+        runs.append([])
+        for network, length, version, path_id in table.entries():
+            if runs[-1] and runs[-1][-1][:2] == [version, length]:
+                runs[-1][-1][2] += 1
+            else:
+                runs[-1].append([version, length, 1])
+            if version == 4:
+                ipv4.append(network)
+            else:
+                ipv6.extend((network >> 64, network & 0xFFFFFFFFFFFFFFFF))
+            ids.append(path_id)
+    paths = tables[0].paths if tables else ()
+    # the sizes keep the empty AS_PATH, the ASN are not split per AS_PATH
+    sizes = array("I", map(len, paths))
+    blob = "\n".join(asn for path in paths for asn in path).encode()
+    meta = dict(meta, layout=LAYOUT, runs=runs, paths=len(paths), blob=len(blob))
+    meta = json.dumps(meta).encode()
+    meta += b" " * (-len(meta) % 8)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as fh:
+            fh.write(HEADER.pack(MAGIC, len(meta)))
+            fh.write(meta)
+            for values in (ipv4, ipv6, ids, sizes):
+                fh.write(_padded(values))
+            fh.write(blob)
+        os.replace(tmp, target)
+    except OSError:
+        return False
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+    return True
+
+
+def save_snapshot(fname, table, count, num_prefix=None, parser=None):
+    """
+    Input: Filename of the mrt file, the PrefixTable parsed from it, the count
+           of mrt entries, the number of entries parsed (--prefixes) and the
+           parser (--parser)
+    Output: True if the snapshot was written
+    """
+    meta = {"source": source_key(fname, num_prefix, parser), "count": count}
+    return write_tables(snapshot_filename(fname), [table], meta)
+
+
+def _read_array(buf, offset, count, typecode):
+    """copy of count integers at offset of the buffer (native byte order)"""
+    size = array(typecode).itemsize
+    if offset + count * size > len(buf):
+        raise ValueError("file is truncated")
+    values = array(typecode)
+    values.frombytes(buf[offset : offset + count * size])
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values, offset + (count * size + 7) // 8 * 8
+
+
+def read_tables(fname, valid=None):
+    """
+    Input: Filename of a file written by write_tables, function returning True
+           if the json meta of the file is valid (default: any meta)
+    Output: tuple of the json meta and the list of PrefixTable sharing one
+            PathTable, None if the file is missing, invalid or truncated
+    Workflow: The AS_PATH table is decoded once into the shared PathTable.
+              Each bucket of each PrefixTable is filled from a slice of the
+              arrays of the file.
+    """
+    try:
+        with open(fname, "rb") as fh:
+            buf = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    with buf:
+        try:
+            magic, meta_len = HEADER.unpack_from(buf)
+            if magic != MAGIC:
+                return None
+            meta = json.loads(buf[HEADER.size : HEADER.size + meta_len])
+            if meta.get("layout") != LAYOUT:
+                return None
+            if valid is not None and not valid(meta):
+                return None
+            runs = [run for table_runs in meta["runs"] for run in table_runs]
+            num4 = sum(n for version, _, n in runs if version == 4)
+            num6 = sum(n for version, _, n in runs if version == 6)
+            offset = HEADER.size + meta_len
+            ipv4, offset = _read_array(buf, offset, num4, "I")
+            ipv6, offset = _read_array(buf, offset, 2 * num6, "Q")
+            ids, offset = _read_array(buf, offset, num4 + num6, "I")
+            sizes, offset = _read_array(buf, offset, meta["paths"], "I")
+            if offset + meta["blob"] > len(buf):
+                raise ValueError("file is truncated")
+            blob = buf[offset : offset + meta["blob"]].decode()
+            asns = blob.split("\n") if blob else []
+            if len(asns) != sum(sizes):
+                raise ValueError("AS_PATH table does not match its sizes")
+        except (KeyError, TypeError, ValueError, struct.error):
+            return None
+    paths = PrefixTable().paths
+    end = 0
+    for size in sizes:
+        paths.intern(asns[end : end + size])
+        end += size
+    ipv6 = iter(ipv6)
+    ipv6 = [high << 64 | low for high, low in zip(ipv6, ipv6)]
+    start = {4: 0, 6: 0}
+    position = 0
+    tables = []
+    for table_runs in meta["runs"]:
+        table = PrefixTable(paths)
+        for version, length, n in table_runs:
+            first = start[version]
+            networks = (ipv4 if version == 4 else ipv6)[first : first + n]
+            table.update_bucket(version, length, networks, ids[position : position + n])
+            start[version] += n
+            position += n
+        tables.append(table)
+    return meta, tables
+
+
+def load_snapshot(fname, num_prefix=None, parser=None):
+    """
+    Input: Filename of the mrt file, the number of entries to parse and the
+           parser (--parser)
+    Output: tuple of the PrefixTable and the count of mrt entries, None if
+            there is no valid snapshot of the mrt file made by the parser
+    """
+    key = source_key(fname, num_prefix, parser)
+    snapshot = read_tables(
+        snapshot_filename(fname), lambda meta: meta.get("source") == key
+    )
+    if snapshot is None:
+        return None
+    meta, tables = snapshot
+    return tables[0], meta["count"]
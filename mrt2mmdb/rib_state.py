@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+This module keep the routes of each BGP peer of a target mmdb file updated by
+--updates. The state is made from every rib entry of a mrt RIB dump, the
+announcements and withdrawals of the update dumps are then applied to the
+routes of their peer only. The state is saved next to the target mmdb file
+(<target>.ribstate) in the layout of the mrt snapshot (rib_snapshot), one
+PrefixTable per peer, and is loaded by the next --updates run instead of the
+previous target.
+"""
+from prefix_table import PrefixTable
+from rib_snapshot import read_tables, write_tables
+
+STATE_SUFFIX = ".ribstate"
+STATE_FORMAT = "mrt2mmdb-ribstate"
+
+
+def state_filename(fname):
+    """return the filename of the state of the target mmdb file"""
+    return fname + STATE_SUFFIX
+
+
+class RibState:
+    """
+    Routes (prefix -> AS_PATH) of each BGP peer in a PrefixTable per peer
+    (self.tables in the order of self.peers), the tables share one PathTable.
+    The peers are ranked in the order they are first seen, the peers of the
+    PEER_INDEX_TABLE of the RIB dump in the order of their index. The route
+    of a prefix in the mmdb file is the one of the first ranked peer having
+    the prefix, like the first rib entry of a RIB dump.
+    """
+
+    def __init__(self, peers=(), tables=None):
+        self.peers = list(peers)
+        self.paths = tables[0].paths if tables else PrefixTable().paths
+        self.tables = tables or [PrefixTable(self.paths) for _ in self.peers]
+        self._ranks = {peer: rank for rank, peer in enumerate(self.peers)}
+
+    def table(self, peer):
+        """PrefixTable of the routes of the peer, added if the peer is new"""
+        rank = self._ranks.get(peer)
+        if rank is None:
+            rank = self._ranks[peer] = len(self.peers)
+            self.peers.append(peer)
+            self.tables.append(PrefixTable(self.paths))
+        return self.tables[rank]
+
+    def announce(self, network, length, version, peer, aspath):
+        """set the route of the prefix of the peer (last one wins)"""
+        self.table(peer).add(network, length, version, aspath)
+
+    def withdraw(self, network, length, version, peer):
+        """remove the route of the prefix of the peer, the other peers keep it"""
+        rank = self._ranks.get(peer)
+        if rank is not None:
+            self.tables[rank].discard(network, length, version)
+
+    def best(self):
+        """
+        Output: PrefixTable of the route of each prefix of the first ranked
+                peer having the prefix
+        Workflow: The tables are merged from the last to the first ranked peer
+                  (the other table wins), the merged table is compacted after
+                  each peer to keep a single route per prefix in memory.
+        """
+        result = PrefixTable(self.paths)
+        for table in reversed(self.tables):
+            result.update(table)
+            result.compact()
+        return result
+
+    def __len__(self):
+        """number of routes of all the peers"""
+        return sum(len(table) for table in self.tables)
+
+
+def save_state(fname, state):
+    """
+    Input: Filename of the target mmdb file and its RibState
+    Output: True if the state was written to <target>.ribstate
+    """
+    meta = {"format": STATE_FORMAT, "peers": state.peers}
+    return write_tables(state_filename(fname), state.tables, meta)
+
+
+def load_state(fname):
+    """
+    Input: Filename of the target mmdb file
+    Output: RibState of the target mmdb file, None if there is no valid state
+    """
+    state = read_tables(
+        state_filename(fname), lambda meta: meta.get("format") == STATE_FORMAT
+    )
+    if state is None:
+        return None
+    meta, tables = state
+    if len(meta["peers"]) != len(tables):
+        return None
+    return RibState(meta["peers"], tables)
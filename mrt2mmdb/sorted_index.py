@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""
+This module keep a read only mapping of integer keys (unsigned 32 bits) to
+byte strings in a single file. The keys are stored as a sorted array followed
+by a table of the offsets of the values in a blob. The file is mmap'd and the
+keys are binary searched, the values are only read when a key is looked up.
+
+File layout (little endian):
+    magic, length of the json meta, number of keys
+    json meta (free form dict, eg. the source of the index)
+    keys     : number of keys * uint32
+    offsets  : (number of keys + 1) * uint64 into the blob
+    blob     : values
+"""
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Mapping
+
+MAGIC = b"MRT2MMDB-INDEX01"
+HEADER = struct.Struct("<16sII")
+
+
+def _align(size):
+    """pad size to a multiple of 8 bytes"""
+    return (size + 7) & ~7
+
+
+def _little_endian(values):
+    """return the bytes of the array in little endian"""
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def write_index(fname, items, meta=None):
+    """
+    Input: Filename of the index, iterable of (key, value) with key an unsigned
+           32 bits integer and value bytes, a json serializable meta dict
+    Output: None. The index is written to a temporary file then renamed to
+            fname, readers never see a partially written index
+    """
+    items = sorted(dict(items).items())
+    keys = array("I", (key for key, _ in items))
+    offsets = array("Q", [0])
+    for _, value in items:
+        offsets.append(offsets[-1] + len(value))
+    meta = json.dumps(meta or {}).encode()
+    tmp = f"{fname}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as fh:
+            fh.write(HEADER.pack(MAGIC, len(meta), len(keys)))
+            fh.write(meta.ljust(_align(len(meta)), b" "))
+            fh.write(_little_endian(keys).ljust(_align(len(keys) * 4), b"\x00"))
+            fh.write(_little_endian(offsets))
+            for _, value in items:
+                fh.write(value)
+        os.replace(tmp, fname)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+class SortedIndex(Mapping):
+    """
+    Read only mapping of key (int) -> value (bytes) of an index file written
+    by write_index. Raise ValueError if the file is not an index.
+    """
+
+    def __init__(self, fname):
+        with open(fname, "rb") as fh:
+            self._buf = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, meta_len, count = HEADER.unpack_from(self._buf)
+            if magic != MAGIC:
+                raise ValueError(f"{fname} is not an index file")
+            offset = HEADER.size
+            self.meta = json.loads(self._buf[offset : offset + meta_len])
+            offset += _align(meta_len)
+            self._keys = self._view(offset, count, "I")
+            offset += _align(count * 4)
+            self._offsets = self._view(offset, count + 1, "Q")
+            self._blob = offset + (count + 1) * 8
+            if self._blob + self._offsets[-1] > len(self._buf):
+                raise ValueError(f"{fname} is truncated")
+        except (struct.error, ValueError):
+            self.close()
+            raise
+
+    def _view(self, offset, count, typecode):
+        """array of count integers at offset, no copy on little endian hosts"""
+        size = array(typecode).itemsize
+        if offset + count * size > len(self._buf):
+            raise ValueError("index is truncated")
+        view = memoryview(self._buf)[offset : offset + count * size]
+        if sys.byteorder == "little":
+            return view.cast(typecode)
+        values = array(typecode, view)
+        view.release()
+        values.byteswap()
+        return values
+
+    def _find(self, key):
+        """return the position of key in the index or None"""
+        if not isinstance(key, int):
+            return None
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return i
+        return None
+
+    def __getitem__(self, key):
+        i = self._find(key)
+        if i is None:
+            raise KeyError(key)
+        start = self._blob + self._offsets[i]
+        return self._buf[start : self._blob + self._offsets[i + 1]]
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def close(self):
+        """release the views and unmap the file"""
+        for name in ("_keys", "_offsets"):
+            view = getattr(self, name, None)
+            if isinstance(view, memoryview):
+                view.release()
+        self._buf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,28 @@
+"""
+pytest configuration, the modules of mrt2mmdb are imported like the scripts
+do (flat imports from the mrt2mmdb directory).
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "mrt2mmdb"))
+
+# shell test run with assert.sh and mmdbctl
+collect_ignore = ["test_filter.py"]
+
+
+def write_mmdb(fname, networks, **kwargs):
+    """
+    Input: Filename of the mmdb file, iterable of (prefix string, data record),
+           arguments of TreeBuilder.to_db_file
+    Output: statistics of the encoder (see TreeBuilder.to_db_file)
+    """
+    # pylint: disable=import-outside-toplevel
+    from mmdb_tree import TreeBuilder
+    from prefix_table import parse_prefix
+
+    tree = TreeBuilder(database_type="mrt2mmdb-test", languages=["en"])
+    for prefix, data in networks:
+        network, length, version = parse_prefix(prefix)
+        tree.insert(network, length, data, version)
+    return tree.to_db_file(str(fname), **kwargs)
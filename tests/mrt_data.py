@@ -0,0 +1,69 @@
+"""Builders of small mrt files (RFC6396) for the tests"""
+import socket
+import struct
+
+TIMESTAMP = 1700000000
+
+
+def _family(address):
+    return socket.AF_INET6 if ":" in address else socket.AF_INET
+
+
+def _prefix(prefix):
+    """length and significant bytes of the prefix (NLRI encoding)"""
+    address, length = prefix.split("/")
+    length = int(length)
+    return (
+        bytes([length])
+        + socket.inet_pton(_family(address), address)[: (length + 7) // 8]
+    )
+
+
+def _mrt(mrt_type, subtype, body):
+    return struct.pack(">IHHI", TIMESTAMP, mrt_type, subtype, len(body)) + body
+
+
+def _attributes(aspath):
+    segment = struct.pack(f">BB{len(aspath)}I", 2, len(aspath), *aspath)
+    origin = struct.pack(">BBBB", 0x40, 1, 1, 0)
+    return origin + struct.pack(">BBB", 0x40, 2, len(segment)) + segment
+
+
+def peer_index_table(peers):
+    """PEER_INDEX_TABLE entry of the list of (peer AS, peer IP)"""
+    body = socket.inet_aton("10.255.255.1") + struct.pack(">H", 0)
+    body += struct.pack(">H", len(peers))
+    for asn, address in peers:
+        ipv6 = ":" in address
+        body += bytes([2 | int(ipv6)]) + socket.inet_aton("10.0.0.1")
+        body += socket.inet_pton(_family(address), address)
+        body += struct.pack(">I", asn)
+    return _mrt(13, 1, body)
+
+
+def rib_entry(sequence, prefix, routes):
+    """RIB_IPV4/IPV6_UNICAST entry of the list of (peer index, AS_PATH)"""
+    subtype = 4 if ":" in prefix else 2
+    body = struct.pack(">I", sequence) + _prefix(prefix)
+    body += struct.pack(">H", len(routes))
+    for index, aspath in routes:
+        attributes = _attributes(aspath)
+        body += struct.pack(">HIH", index, TIMESTAMP, len(attributes)) + attributes
+    return _mrt(13, subtype, body)
+
+
+def update(peer, announced=(), withdrawn=(), aspath=()):
+    """
+    BGP4MP_MESSAGE_AS4 entry of an ipv4 UPDATE of the peer (peer AS, peer IP)
+    announcing and withdrawing ipv4 prefixes
+    """
+    withdrawn = b"".join(map(_prefix, withdrawn))
+    attributes = _attributes(aspath) if announced else b""
+    message = struct.pack(">H", len(withdrawn)) + withdrawn
+    message += struct.pack(">H", len(attributes)) + attributes
+    message += b"".join(map(_prefix, announced))
+    message = b"\xff" * 16 + struct.pack(">HB", 19 + len(message), 2) + message
+    asn, address = peer
+    body = struct.pack(">IIHH", asn, 64512, 0, 1)
+    body += socket.inet_aton(address) + socket.inet_aton("10.255.255.1")
+    return _mrt(16, 4, body + message)
@@ -0,0 +1,62 @@
+"""Tests of lookup.py --asn and the ASN->networks index of asn_prefix"""
+import json
+import os
+import subprocess
+import sys
+import pytest
+from conftest import write_mmdb
+from asn_prefix import index_filename, lookup_asns, save_asn_prefix
+
+LOOKUP = os.path.join(os.path.dirname(__file__), "..", "mrt2mmdb", "lookup.py")
+NETWORKS = [
+    ("1.0.0.0/24", {"autonomous_system_number": 13335}),
+    ("1.1.1.0/24", {"autonomous_system_number": 13335}),
+    ("8.8.8.0/24", {"autonomous_system_number": 15169}),
+]
+
+
+@pytest.fixture
+def mmdb(tmp_path):
+    fname = tmp_path / "target.mmdb"
+    write_mmdb(fname, NETWORKS)
+    return str(fname)
+
+
+def run_asn(mmdb, asns):
+    result = subprocess.run(
+        [sys.executable, LOOKUP, "--mmdb", mmdb, "--asn", asns],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout)
+
+
+def test_asn_output_shape(mmdb):
+    one = run_asn(mmdb, "13335")
+    assert one == {
+        "13335": [
+            ["1.0.0.0/24", {"autonomous_system_number": 13335}],
+            ["1.1.1.0/24", {"autonomous_system_number": 13335}],
+        ]
+    }
+    many = run_asn(mmdb, "13335,15169")
+    assert many["13335"] == one["13335"]
+    assert many["15169"] == [["8.8.8.0/24", {"autonomous_system_number": 15169}]]
+    # the lookups do not write the index
+    assert not os.path.exists(index_filename(mmdb))
+
+
+def test_index_same_result(mmdb):
+    scanned = lookup_asns(mmdb, ["13335", "15169", "1"])
+    assert save_asn_prefix(mmdb) == 3
+    assert lookup_asns(mmdb, ["13335", "15169", "1"]) == scanned
+
+
+def test_build_read_only(mmdb, monkeypatch):
+    def read_only(*_):
+        raise PermissionError("read only directory")
+
+    monkeypatch.setattr("asn_prefix.write_index", read_only)
+    result = lookup_asns(mmdb, ["15169"], build=True)
+    assert result == {"15169": [("8.8.8.0/24", {"autonomous_system_number": 15169})]}
@@ -0,0 +1,47 @@
+"""Tests of difference.py --compare_routing"""
+import json
+import os
+import subprocess
+import sys
+from conftest import write_mmdb
+
+DIFFERENCE = os.path.join(
+    os.path.dirname(__file__), "..", "mrt2mmdb", "difference.py"
+)
+
+
+def test_print_changes_ndjson(tmp_path):
+    old = tmp_path / "yesterday.mmdb"
+    new = tmp_path / "today.mmdb"
+    write_mmdb(
+        old,
+        [
+            ("1.0.4.0/22", {"autonomous_system_number": 38803}),
+            ("1.0.16.0/24", {"autonomous_system_number": 2519}),
+            ("1.0.32.0/24", {"autonomous_system_number": 13335}),
+        ],
+    )
+    write_mmdb(
+        new,
+        [
+            ("1.0.4.0/22", {"autonomous_system_number": 4826}),
+            ("1.0.32.0/24", {"autonomous_system_number": 13335}),
+            ("1.0.64.0/18", {"autonomous_system_number": 18144}),
+        ],
+    )
+    result = subprocess.run(
+        [sys.executable, DIFFERENCE, "--compare_routing", str(old), str(new)]
+        + ["--print_changes", "--quiet"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    changes = [json.loads(line) for line in result.stdout.splitlines()]
+    assert changes == [
+        {"change": "changed", "key": "1.0.4.0/22", "old": "38803", "new": "4826"},
+        {"change": "removed", "key": "1.0.16.0/24", "old": "2519", "new": None},
+        {"change": "added", "key": "1.0.64.0/18", "old": None, "new": "18144"},
+    ]
+    assert "added = 1" in result.stderr
+    assert "removed = 1" in result.stderr
+    assert "changed = 1" in result.stderr
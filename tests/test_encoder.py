@@ -0,0 +1,160 @@
+"""Tests of the encoding of the data section (mmdb_encoder)"""
+import maxminddb
+import maxminddb.decoder
+import maxminddb.reader
+import pytest
+from tqdm import tqdm
+from conftest import write_mmdb
+from filter import rewrite, rewrite_metadata
+from mmdb_encoder import METADATA_MAGIC, Encoder, encode_records, pointer_value
+from mmdb_tree import pack_nodes, unpack_nodes
+
+CACHES = [(0, "all"), (3, "all"), (0, "leaf"), (3, "leaf")]
+
+
+def records():
+    result = []
+    for i in range(200):
+        country = {"iso_code": f"C{i % 7}", "names": {"en": f"Country {i % 7}"}}
+        result.append(
+            {
+                "asn": 64512 + i % 13,
+                "country": country,
+                "tags": ["bgp", f"tag{i % 5}", [i % 3, 1.5]],
+                "anycast": i % 2 == 0,
+                "prefix": f"10.{i}.0.0/16",
+            }
+        )
+    return result
+
+
+@pytest.mark.parametrize("cache_size, cache_policy", CACHES)
+def test_encode_records(cache_size, cache_policy):
+    encoders = []
+    pointers = []
+    for workers in (1, 3):
+        encoder = Encoder(cache=True, cache_size=cache_size, cache_policy=cache_policy)
+        pointers.append(encode_records(encoder, records(), workers))
+        encoders.append(encoder)
+    serial, parallel = encoders
+    assert pointers[0] == pointers[1]
+    assert bytes(serial.data) == bytes(parallel.data)
+    assert serial.cache_stats() == parallel.cache_stats()
+
+
+def test_merge_shard_bounded_cache():
+    encoder = Encoder(cache=True, cache_size=3)
+    assert not encoder.shardable
+    with pytest.raises(ValueError):
+        encoder.merge_shard([], [], [], [], [])
+
+
+@pytest.mark.parametrize("cache_size, cache_policy", CACHES)
+def test_rewrite_workers(tmp_path, cache_size, cache_policy):
+    fname = tmp_path / "target.mmdb"
+    write_mmdb(fname, [(f"10.{i}.0.0/16", r) for i, r in enumerate(records())])
+    result = []
+    for workers in (1, 3):
+        with tqdm(disable=True) as pb:
+            stats = rewrite(
+                str(fname),
+                pb,
+                trim=["prefix"],
+                cache_size=cache_size,
+                cache_policy=cache_policy,
+                workers=workers,
+            )
+        result.append((stats, (tmp_path / "target.mmdb.trim").read_bytes()))
+    assert result[0] == result[1]
+
+
+LONG = "long string " * 100
+RECORDS = {
+    "1.0.0.0/24": {
+        "map": {"nested": {"en": "Name", "de": "Name"}, "empty": {}},
+        "array": [1, "two", [3.5, False], {"four": 4}],
+        "uint16": 0xFFFF,
+        "uint32": 0xFFFFFFFF,
+        "uint64": 0xFFFFFFFFFFFFFFFF,
+        "uint128": 1 << 127 | 1,
+        "true": True,
+        "false": False,
+        "float": 0.5,
+        "long": LONG,
+        "utf8": "\u00e9t\u00e9",
+    },
+    "2001:db8::/32": {"long": LONG, "map": {"nested": {"en": "Name", "de": "Name"}}},
+    "10.0.0.0/8": {"long": LONG, "array": []},
+}
+
+
+def set_record_size(fname, record_size):
+    """write the search tree of the mmdb file again with the record size"""
+    with maxminddb.reader.Reader(str(fname), maxminddb.MODE_MMAP) as reader:
+        meta = reader.metadata()
+        # pylint: disable=protected-access
+        buf = reader._buffer
+        nodes = unpack_nodes(buf[: meta.search_tree_size], meta.record_size)
+        start = buf.rfind(METADATA_MAGIC)
+        data = buf[meta.search_tree_size : start]
+        metadata = rewrite_metadata(reader, start, meta.node_count, record_size)
+    fname.write_bytes(pack_nodes(nodes, record_size) + data + metadata)
+
+
+@pytest.mark.parametrize("record_size", [24, 28, 32])
+def test_round_trip(tmp_path, record_size):
+    fname = tmp_path / "target.mmdb"
+    write_mmdb(fname, RECORDS.items())
+    set_record_size(fname, record_size)
+    with maxminddb.open_database(str(fname)) as reader:
+        assert reader.metadata().record_size == record_size
+        for prefix, record in RECORDS.items():
+            data, length = reader.get_with_prefix_len(prefix.split("/")[0])
+            assert data == record
+            assert length == int(prefix.split("/")[1])
+        assert reader.get("11.0.0.1") is None
+    # the repeated values are written once and referred by pointers
+    content = fname.read_bytes()
+    assert content.count(LONG.encode()) == 1
+    assert content.count(b"nested") == 1
+
+
+@pytest.mark.parametrize(
+    "value, type_id",
+    [
+        (0.1, 3),
+        (b"\x00\xffbytes", 4),
+        (0, 5),
+        (0xFFFF, 5),
+        (0xFFFFFFFF, 6),
+        (-(1 << 31), 8),
+        (0xFFFFFFFFFFFFFFFF, 9),
+        ((1 << 128) - 1, 10),
+        ("x" * 70000, 2),
+        (1.5, 15),
+    ],
+)
+def test_encode_types(value, type_id):
+    encoder = Encoder(cache=False)
+    buf = encoder.encode(value, type_id)
+    decoded, offset = maxminddb.decoder.Decoder(buf).decode(0)
+    assert decoded == value
+    assert offset == len(buf)
+
+
+def test_pointer_reuse():
+    encoder = Encoder(cache=True)
+    first = encoder.encode({"key": "value", "list": [1, 2]})
+    size = len(encoder.data)
+    again = encoder.encode({"key": "value", "list": [1, 2]})
+    assert again == first
+    assert len(encoder.data) == size
+    record = {"other": {"key": "value", "list": [1, 2]}}
+    pointer = encoder.encode(record)
+    data = bytes(encoder.data)
+    decoded, _ = maxminddb.decoder.Decoder(data).decode(pointer_value(pointer))
+    assert decoded == record
+    stats = encoder.cache_stats()
+    assert stats["hits"] >= 2
+    assert stats["bytes_written"] == len(data)
+
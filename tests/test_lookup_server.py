@@ -0,0 +1,98 @@
+"""Tests of the lookup service of lookup_server"""
+import http.client
+import json
+import os
+import threading
+import pytest
+from conftest import write_mmdb
+from lookup_server import make_server
+
+ASN = {"autonomous_system_number": 13335, "autonomous_system_organization": "CF"}
+
+
+@pytest.fixture
+def server(tmp_path):
+    """lookup service of a mmdb file on a free tcp port of localhost"""
+    fname = tmp_path / "target.mmdb"
+    write_mmdb(fname, [("1.1.1.0/24", ASN)])
+    srv = make_server(str(fname), "127.0.0.1:0")
+    srv.reader.interval = 0
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv, fname
+    srv.shutdown()
+    srv.server_close()
+
+
+def request(srv, method, path, body=None, headers=None):
+    """status and json reply of a request to the server"""
+    conn = http.client.HTTPConnection(*srv.server_address[:2], timeout=5)
+    try:
+        conn.request(method, path, body, headers or {})
+        reply = conn.getresponse()
+        return reply.status, json.loads(reply.read())
+    finally:
+        conn.close()
+
+
+def test_get(server):
+    srv, _ = server
+    status, result = request(srv, "GET", "/?ip=1.1.1.1")
+    assert status == 200
+    assert result["network"] == "1.1.1.0/24"
+    assert result["data"] == ASN
+
+
+def test_invalid_file_keeps_reader(server):
+    srv, fname = server
+    tmp = f"{fname}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(b"partly written mmdb file")
+    os.replace(tmp, fname)
+    status, result = request(srv, "GET", "/?ip=1.1.1.1")
+    assert status == 200
+    assert result["data"] == ASN
+    # a valid file is loaded again
+    write_mmdb(f"{fname}.new", [("1.1.1.0/24", {"autonomous_system_number": 1})])
+    os.replace(f"{fname}.new", fname)
+    _, result = request(srv, "GET", "/?ip=1.1.1.1")
+    assert result["data"] == {"autonomous_system_number": 1}
+
+
+@pytest.mark.parametrize("length", ["-1", "abc"])
+def test_invalid_content_length(server, length):
+    srv, _ = server
+    status, result = request(
+        srv, "POST", "/", b'["1.1.1.1"]', {"Content-Length": length}
+    )
+    assert status == 400
+    assert "Content-Length" in result["error"]
+
+
+def test_post(server):
+    srv, _ = server
+    status, result = request(srv, "POST", "/", b'["1.1.1.1", "x"]')
+    assert status == 200
+    assert result[0]["network"] == "1.1.1.0/24"
+    assert "error" in result[1]
+
+
+def test_unix_socket(tmp_path):
+    fname = tmp_path / "target.mmdb"
+    write_mmdb(fname, [("1.1.1.0/24", ASN)])
+    path = str(tmp_path / "lookup.sock")
+    # a socket left by a previous server is replaced
+    for _ in range(2):
+        srv = make_server(str(fname), "unix:" + path)
+        assert srv.server_address == path
+        srv.server_close()
+
+
+@pytest.mark.parametrize("address", ["{mmdb}", "unix:{mmdb}"])
+def test_address_not_a_socket(tmp_path, address):
+    fname = tmp_path / "target.mmdb"
+    write_mmdb(fname, [("1.1.1.0/24", ASN)])
+    content = fname.read_bytes()
+    with pytest.raises((ValueError, FileExistsError)):
+        make_server(str(fname), address.format(mmdb=fname))
+    assert fname.read_bytes() == content
@@ -0,0 +1,85 @@
+"""Tests of the search tree of mmdb_tree.TreeBuilder"""
+import ipaddress
+import random
+import maxminddb
+import pytest
+from conftest import write_mmdb
+from mmdb_encoder import METADATA_MAGIC
+from mmdb_tree import TreeBuilder
+from prefix_table import parse_prefix
+
+
+def random_prefixes(rng, count):
+    """overlapping ipv4 and ipv6 prefixes, some of them inserted twice"""
+    prefixes = []
+    for _ in range(count):
+        if rng.random() < 0.7:
+            length = rng.randint(8, 30)
+            base = 0x0A000000 | rng.getrandbits(24)
+            network = ipaddress.ip_network((base, length), strict=False)
+        else:
+            length = rng.randint(32, 64)
+            base = 0x20010DB8 << 96 | rng.getrandbits(96)
+            network = ipaddress.ip_network((base, length), strict=False)
+        prefixes.append(str(network))
+    prefixes += rng.sample(prefixes, count // 10)
+    return prefixes
+
+
+def longest_match(networks, address):
+    """(data, prefix length) of the most specific network holding address"""
+    best = None
+    for network, data in networks.items():
+        if address in network and (best is None or network.prefixlen > best[1]):
+            best = (data, network.prefixlen)
+    return best
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_longest_prefix_match(tmp_path, seed):
+    rng = random.Random(seed)
+    inserted = [
+        (prefix, {"prefix": prefix, "order": order})
+        for order, prefix in enumerate(random_prefixes(rng, 300))
+    ]
+    fname = tmp_path / "target.mmdb"
+    write_mmdb(fname, inserted)
+    # the last insertion of a prefix wins
+    networks = {ipaddress.ip_network(p): data for p, data in inserted}
+    addresses = []
+    for network in networks:
+        addresses += [network.network_address, network.broadcast_address]
+        addresses.append(network.network_address + rng.getrandbits(8))
+    addresses += [ipaddress.ip_address("9.255.255.255"), ipaddress.ip_address("::1")]
+    with maxminddb.open_database(str(fname)) as reader:
+        for address in addresses:
+            data, length = reader.get_with_prefix_len(str(address))
+            expected = longest_match(networks, address)
+            if expected is None:
+                assert data is None
+            else:
+                # the leaf of a prefix split by a more specific one is deeper
+                assert data == expected[0]
+                assert length >= expected[1]
+
+
+def test_resolve(tmp_path):
+    rng = random.Random(4)
+    inserted = random_prefixes(rng, 200)
+    write_mmdb(tmp_path / "records.mmdb", [(p, {"prefix": p}) for p in inserted])
+
+    # the same tree with the index of the prefix as record
+    tree = TreeBuilder(
+        database_type="mrt2mmdb-test",
+        languages=["en"],
+        resolve=lambda key: {"prefix": inserted[key]},
+    )
+    for key, prefix in enumerate(inserted):
+        network, length, version = parse_prefix(prefix)
+        tree.insert(network, length, key, version)
+    tree.to_db_file(str(tmp_path / "keys.mmdb"), workers=2)
+    files = []
+    for name in ("records.mmdb", "keys.mmdb"):
+        content = (tmp_path / name).read_bytes()
+        files.append(content[: content.rfind(METADATA_MAGIC)])
+    assert files[0] == files[1]
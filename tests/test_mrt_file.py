@@ -0,0 +1,50 @@
+"""Tests of the background decompression of mrt_file.open_mrt"""
+import bz2
+import gzip
+import os
+import pytest
+from mrt_file import open_mrt
+
+# larger than a read of the decompression thread (PIPE_SIZE)
+DATA = os.urandom(1024 * 1024) * 4
+
+
+@pytest.fixture(scope="module", params=["gz", "bz2"])
+def compressed(request, tmp_path_factory):
+    """complete and truncated compressed files of DATA"""
+    tmp_path = tmp_path_factory.mktemp("mrt")
+    compress = gzip.compress if request.param == "gz" else bz2.compress
+    blob = compress(DATA)
+    complete = tmp_path / f"rib.mrt.{request.param}"
+    complete.write_bytes(blob)
+    truncated = tmp_path / f"trunc.mrt.{request.param}"
+    truncated.write_bytes(blob[: len(blob) // 2])
+    return str(complete), str(truncated)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_read_complete(compressed, workers):
+    with open_mrt(compressed[0], workers) as fh:
+        assert fh.read() == DATA
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_truncated_raises(compressed, workers):
+    with pytest.raises(EOFError):
+        with open_mrt(compressed[1], workers) as fh:
+            while fh.read(4096):
+                pass
+
+
+def test_truncated_raises_once(compressed):
+    fh = open_mrt(compressed[1])
+    with pytest.raises(EOFError):
+        while fh.read():
+            pass
+    fh.close()
+
+
+def test_close_early(compressed):
+    # the rest of the file (and its error) is not read
+    with open_mrt(compressed[1]) as fh:
+        assert fh.read(4096) == DATA[:4096]
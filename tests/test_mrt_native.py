@@ -0,0 +1,55 @@
+"""Tests of the native TABLE_DUMP_V2 decoder of mrt_native against mrtparse"""
+import gzip
+import pytest
+from mrt_data import peer_index_table, rib_entry, update
+from make_mmdb import iter_mrtparse
+from mrt_native import iter_native
+from prefix_table import parse_prefix
+
+PEERS = [(65001, "10.0.0.1"), (65002, "2001:db8::2")]
+RIB = [
+    ("0.0.0.0/0", [(0, [65001, 3356])]),
+    ("1.0.0.0/24", [(0, [65001, 13335]), (1, [65002, 174, 13335])]),
+    ("1.0.4.0/22", [(1, [65002, 4826, 38803])]),
+    ("10.1.2.128/25", [(0, [65001, 4200000000])]),
+    ("192.0.2.1/32", [(0, [65001, 64512, 64512, 64513])]),
+    ("2001:db8::/32", [(1, [65002, 6939])]),
+    ("2001:db8:1234:5600::/56", [(0, [65001, 6939, 64496])]),
+    ("::/0", [(1, [65002])]),
+]
+
+
+@pytest.fixture(params=["mrt", "mrt.gz"])
+def rib(tmp_path, request):
+    data = (
+        peer_index_table(PEERS)
+        + b"".join(rib_entry(i, *entry) for i, entry in enumerate(RIB))
+        # not a TABLE_DUMP_V2 entry
+        + update(PEERS[0], announced=["5.0.0.0/8"], aspath=[65001, 1])
+    )
+    fname = tmp_path / f"rib.{request.param}"
+    fname.write_bytes(gzip.compress(data) if request.param.endswith("gz") else data)
+    return str(fname)
+
+
+def normalized(entries):
+    return [entry and (*entry[:3], tuple(map(str, entry[3]))) for entry in entries]
+
+
+def test_native_equals_mrtparse(rib):
+    expected = [
+        entry and (*parse_prefix(entry[0]), entry[1])
+        for entry in iter_mrtparse(rib, None)
+    ]
+    native = list(iter_native(rib))
+    assert normalized(native) == normalized(expected)
+    assert len(native) == len(RIB) + 2
+
+
+@pytest.mark.parametrize("num_prefix", [1, 3, 20])
+def test_num_prefix(rib, num_prefix):
+    expected = normalized(
+        entry and (*parse_prefix(entry[0]), entry[1])
+        for entry in iter_mrtparse(rib, num_prefix)
+    )
+    assert normalized(iter_native(rib, num_prefix)) == expected
@@ -0,0 +1,84 @@
+"""Tests of prefix_table.PrefixTable"""
+from prefix_table import PrefixTable, format_prefix, parse_prefix
+
+
+def prefixes(table):
+    return [(format_prefix(*entry[:3]), entry[3]) for entry in table.items()]
+
+
+def test_last_one_wins():
+    table = PrefixTable()
+    table["10.0.0.0/8"] = ["1"]
+    table["10.1.0.0/16"] = ["2"]
+    table["10.2.0.0/16"] = ["3"]
+    table["10.1.0.0/16"] = ["4"]
+    assert len(table) == 3
+    # the prefix keeps the position of its first insertion
+    assert prefixes(table) == [
+        ("10.0.0.0/8", ("1",)),
+        ("10.1.0.0/16", ("4",)),
+        ("10.2.0.0/16", ("3",)),
+    ]
+    # the AS_PATH are interned once
+    table["10.3.0.0/16"] = ["4"]
+    assert len(table.paths) == 4
+
+
+def test_discard():
+    table = PrefixTable()
+    table["10.1.0.0/16"] = ["1"]
+    table["10.2.0.0/16"] = ["2"]
+    table.discard(*parse_prefix("10.1.0.0/16"))
+    # a prefix not in the table is ignored
+    table.discard(*parse_prefix("10.3.0.0/16"))
+    assert prefixes(table) == [("10.2.0.0/16", ("2",))]
+    table["10.1.0.0/16"] = ["3"]
+    table.discard(*parse_prefix("10.2.0.0/16"))
+    table["10.2.0.0/16"] = ["4"]
+    assert prefixes(table) == [("10.2.0.0/16", ("4",)), ("10.1.0.0/16", ("3",))]
+
+
+def test_compact():
+    table = PrefixTable()
+    for i in range(10):
+        table["10.0.0.0/8"] = [str(i)]
+    table.compact()
+    table.compact()
+    assert len(table) == 1
+    assert prefixes(table) == [("10.0.0.0/8", ("9",))]
+
+
+def test_entries_order():
+    table = PrefixTable()
+    for prefix in ["1.0.0.0/24", "::/120", "2001:db8::/32", "0.0.0.0/0", "::/0"]:
+        table[prefix] = []
+    # from the least to the most specific prefix of a ipv6 tree (::/96 mapping)
+    assert [prefix for prefix, _ in prefixes(table)] == [
+        "::/0",
+        "2001:db8::/32",
+        "0.0.0.0/0",
+        "::/120",
+        "1.0.0.0/24",
+    ]
+
+
+def test_update_other_wins():
+    table = PrefixTable()
+    table["10.1.0.0/16"] = ["1"]
+    table["10.2.0.0/16"] = ["2"]
+    other = PrefixTable()
+    other["10.2.0.0/16"] = ["3"]
+    other["2001:db8::/32"] = ["4"]
+    # the routes of the other table are merged, not its removals
+    other.discard(*parse_prefix("10.1.0.0/16"))
+    table.update(other)
+    assert prefixes(table) == [
+        ("2001:db8::/32", ("4",)),
+        ("10.1.0.0/16", ("1",)),
+        ("10.2.0.0/16", ("3",)),
+    ]
+    # tables sharing one PathTable
+    shared = PrefixTable(table.paths)
+    shared["10.2.0.0/16"] = ["2"]
+    table.update(shared)
+    assert prefixes(table)[-1] == ("10.2.0.0/16", ("2",))
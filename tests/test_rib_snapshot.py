@@ -0,0 +1,70 @@
+"""Tests of the mrt snapshot of rib_snapshot"""
+import os
+import subprocess
+import sys
+import maxminddb
+import pytest
+from mrt_data import peer_index_table, rib_entry
+from prefix_table import PrefixTable
+from rib_snapshot import load_snapshot, save_snapshot
+
+MAKE_MMDB = os.path.join(os.path.dirname(__file__), "..", "mrt2mmdb", "make_mmdb.py")
+
+
+@pytest.fixture
+def table():
+    result = PrefixTable()
+    result["1.0.0.0/24"] = ["13335"]
+    result["2001:db8::/32"] = ["174", "64512"]
+    return result
+
+
+def test_save_load(tmp_path, table):
+    fname = tmp_path / "rib.mrt"
+    fname.write_bytes(b"mrt")
+    assert save_snapshot(str(fname), table, 2, None, "native")
+    loaded, count = load_snapshot(str(fname), None, "native")
+    assert count == 2
+    assert list(loaded.items()) == list(table.items())
+
+
+@pytest.mark.parametrize(
+    "num_prefix, parser", [(None, "mrtparse"), (None, "bgpscanner"), (10, "native")]
+)
+def test_key(tmp_path, table, num_prefix, parser):
+    fname = tmp_path / "rib.mrt"
+    fname.write_bytes(b"mrt")
+    save_snapshot(str(fname), table, 2, None, "native")
+    assert load_snapshot(str(fname), num_prefix, parser) is None
+
+
+def test_empty_path(tmp_path, table):
+    table["10.0.0.0/8"] = []
+    fname = tmp_path / "rib.mrt"
+    fname.write_bytes(b"mrt")
+    assert save_snapshot(str(fname), table, 3, None, "native")
+    loaded, _ = load_snapshot(str(fname), None, "native")
+    assert list(loaded.items()) == list(table.items())
+    assert (0x0A000000, 8, 4, ()) in list(loaded.items())
+
+
+@pytest.mark.parametrize("parser", ["native", "mrtparse"])
+def test_convert_twice_empty_path(tmp_path, parser):
+    rib = tmp_path / "rib.mrt"
+    rib.write_bytes(
+        peer_index_table([(65001, "10.0.0.1")])
+        + rib_entry(0, "30.0.0.0/24", [(0, [])])
+        + rib_entry(1, "40.0.0.0/24", [(0, [65001, 2])])
+    )
+    lookup = tmp_path / "asn.csv"
+    lookup.write_text("2,Org,ARIN,US\n")
+    target = tmp_path / "target.mmdb"
+    command = [sys.executable, MAKE_MMDB, "--lookup_file", str(lookup)]
+    command += ["--custom_lookup_only", "--quiet", "--parser", parser]
+    command += ["--mrt", str(rib), "--target", str(target)]
+    for _ in range(2):
+        subprocess.run(command, check=True)
+        with maxminddb.open_database(str(target)) as reader:
+            assert reader.get("30.0.0.1")["autonomous_system_number"] == 0
+            assert reader.get("40.0.0.1")["autonomous_system_number"] == 2
+    assert os.path.isfile(str(rib) + ".ribsnap")
@@ -0,0 +1,42 @@
+"""Tests of mrt2mmdb --stream"""
+import os
+import subprocess
+import sys
+import maxminddb
+from mrt_data import peer_index_table, rib_entry
+
+MAKE_MMDB = os.path.join(os.path.dirname(__file__), "..", "mrt2mmdb", "make_mmdb.py")
+RIB = [
+    ("20.0.0.0/8", [(0, [65001, 400])]),
+    ("20.0.0.0/9", [(0, [65001, 401])]),
+    ("30.0.0.0/24", [(0, [65001, 500])]),
+    ("2001:db8::/32", [(0, [65001, 600])]),
+    ("50.0.0.0/24", [(0, [])]),
+    # a prefix seen again keeps the last entry
+    ("30.0.0.0/24", [(0, [65001, 501])]),
+]
+
+
+def convert(tmp_path, target, *arguments):
+    rib = tmp_path / "rib.mrt"
+    rib.write_bytes(
+        peer_index_table([(65001, "10.0.0.1")])
+        + b"".join(rib_entry(i, *entry) for i, entry in enumerate(RIB))
+    )
+    lookup = tmp_path / "asn.csv"
+    lookup.write_text("400,Org,ARIN,US\n")
+    subprocess.run(
+        [sys.executable, MAKE_MMDB, "--lookup_file", str(lookup)]
+        + ["--custom_lookup_only", "--quiet", "--no_cache", "--parser", "native"]
+        + ["--mrt", str(rib), "--target", str(target)]
+        + list(arguments),
+        check=True,
+    )
+    with maxminddb.open_database(str(target)) as reader:
+        return [(str(network), data) for network, data in reader]
+
+
+def test_stream_matches_conversion(tmp_path):
+    full = convert(tmp_path, tmp_path / "full.mmdb")
+    assert convert(tmp_path, tmp_path / "stream.mmdb", "--stream") == full
+    assert dict(full)["30.0.0.0/24"]["autonomous_system_number"] == 501
@@ -0,0 +1,71 @@
+"""Tests of filter.py (trim of mmdb files)"""
+import os
+import subprocess
+import sys
+import maxminddb
+import pytest
+from tqdm import tqdm
+from conftest import write_mmdb
+from filter import rewrite
+
+FILTER = os.path.join(os.path.dirname(__file__), "..", "mrt2mmdb", "filter.py")
+
+NETWORKS = [
+    ("1.0.0.0/24", {"network": "1.0.0.0/24", "asn": 13335}),
+    ("1.0.1.0/24", {"network": "1.0.1.0/24", "asn": 13335}),
+    ("1.0.2.0/24", {"network": "1.0.2.0/24", "asn": 174}),
+    ("2001:db8::/32", {"network": "2001:db8::/32", "asn": 64512}),
+]
+
+
+def networks(fname):
+    with maxminddb.open_database(str(fname)) as reader:
+        return [(str(network), data) for network, data in reader]
+
+
+@pytest.fixture
+def mmdb(tmp_path):
+    fname = tmp_path / "target.mmdb"
+    write_mmdb(fname, NETWORKS)
+    return fname
+
+
+def trim(fname, **kwargs):
+    with tqdm(disable=True) as pb:
+        rewrite(str(fname), pb, trim=["network"], **kwargs)
+    return networks(str(fname) + ".trim")
+
+
+def test_trim_keeps_networks(mmdb):
+    expected = [
+        (network, {k: v for k, v in data.items() if k != "network"})
+        for network, data in networks(mmdb)
+    ]
+    assert trim(mmdb) == expected
+
+
+def test_trim_merge(mmdb):
+    trimmed = dict(trim(mmdb, merge=True))
+    assert trimmed["1.0.0.0/23"] == {"asn": 13335}
+    assert trimmed["1.0.2.0/24"] == {"asn": 174}
+    assert "1.0.0.0/24" not in trimmed
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_trim_files_errors(tmp_path, mmdb, workers):
+    corrupt = tmp_path / "corrupt.mmdb"
+    corrupt.write_bytes(b"not a mmdb file")
+    missing = tmp_path / "missing.mmdb"
+    result = subprocess.run(
+        [sys.executable, FILTER, "--trim", "network", "--quiet"]
+        + ["--workers", str(workers), "--mmdbs"]
+        + [str(missing), str(corrupt), str(mmdb)],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    assert result.returncode == 1
+    assert str(missing) in result.stderr
+    assert str(corrupt) in result.stderr
+    # the good file is trimmed anyway
+    assert networks(str(mmdb) + ".trim") == trim(mmdb)
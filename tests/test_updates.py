@@ -0,0 +1,126 @@
+"""Tests of mrt2mmdb --updates (make_mmdb.load_updates and rib_state)"""
+import os
+import subprocess
+import sys
+import maxminddb
+import pytest
+from mrt_data import peer_index_table, rib_entry, update
+from rib_state import RibState, load_state, save_state, state_filename
+
+MAKE_MMDB = os.path.join(os.path.dirname(__file__), "..", "mrt2mmdb", "make_mmdb.py")
+PEER_A = (65001, "10.0.0.1")
+PEER_B = (65002, "10.0.0.2")
+RIB = [
+    ("30.0.0.0/24", [(0, [65001, 500]), (1, [65002, 501])]),
+    # route originated by the peer itself
+    ("50.0.0.0/24", [(1, [])]),
+    ("10.2.0.0/16", [(1, [65002, 300])]),
+    # 20.0.0.0/8 is hidden by its more specific prefixes
+    ("20.0.0.0/8", [(0, [65001, 400])]),
+    ("20.0.0.0/9", [(0, [65001, 401])]),
+    ("20.128.0.0/9", [(0, [65001, 402])]),
+]
+
+
+def run(tmp_path, *arguments):
+    lookup = tmp_path / "asn.csv"
+    lookup.write_text("1,Org,ARIN,US\n2,Org,ARIN,US\n")
+    subprocess.run(
+        [sys.executable, MAKE_MMDB, "--lookup_file", str(lookup)]
+        + ["--custom_lookup_only", "--quiet", "--no_cache"]
+        + list(map(str, arguments)),
+        check=True,
+    )
+
+
+def origin(target, address):
+    with maxminddb.open_database(str(target)) as reader:
+        data = reader.get(address)
+    return data and data["autonomous_system_number"]
+
+
+@pytest.fixture
+def rib(tmp_path):
+    fname = tmp_path / "rib.mrt"
+    fname.write_bytes(
+        peer_index_table([PEER_A, PEER_B])
+        + b"".join(rib_entry(i, *entry) for i, entry in enumerate(RIB))
+    )
+    return fname
+
+
+def test_state_matches_rib_conversion(tmp_path, rib):
+    full = tmp_path / "full.mmdb"
+    run(tmp_path, "--mrt", rib, "--target", full, "--parser", "native")
+    empty = tmp_path / "empty.mrt"
+    empty.write_bytes(b"")
+    target = tmp_path / "target.mmdb"
+    run(tmp_path, "--mrt", rib, "--target", target, "--updates", empty)
+    assert os.path.isfile(state_filename(str(target)))
+    for address in (
+        "30.0.0.1",
+        "10.2.0.1",
+        "20.0.0.1",
+        "20.200.0.1",
+        "40.0.0.1",
+        "50.0.0.1",
+    ):
+        assert origin(target, address) == origin(full, address)
+
+
+def test_withdraw_per_peer(tmp_path, rib):
+    updates = tmp_path / "updates.mrt"
+    updates.write_bytes(
+        update(PEER_A, withdrawn=["30.0.0.0/24", "20.0.0.0/9", "20.128.0.0/9"])
+    )
+    target = tmp_path / "target.mmdb"
+    run(tmp_path, "--mrt", rib, "--target", target, "--updates", updates)
+    # peer B still has the prefix withdrawn by peer A
+    assert origin(target, "30.0.0.1") == 501
+    # the hidden prefix is back once its more specific prefixes are withdrawn
+    assert origin(target, "20.0.0.1") == 400
+    assert origin(target, "20.200.0.1") == 400
+
+    # the next run starts from the state saved next to the target
+    updates.write_bytes(
+        update(PEER_B, withdrawn=["30.0.0.0/24"])
+        + update((65003, "10.0.0.3"), announced=["40.0.0.0/24"], aspath=[65003, 2])
+    )
+    run(tmp_path, "--target", target, "--updates", updates)
+    assert origin(target, "30.0.0.1") is None
+    assert origin(target, "40.0.0.1") == 2
+    assert origin(target, "10.2.0.1") == 300
+    assert origin(target, "20.0.0.1") == 400
+    assert origin(target, "50.0.0.1") == 0
+
+
+def test_missing_state(tmp_path):
+    updates = tmp_path / "updates.mrt"
+    updates.write_bytes(update(PEER_A, withdrawn=["30.0.0.0/24"]))
+    result = subprocess.run(
+        [sys.executable, MAKE_MMDB, "--quiet", "--custom_lookup_only"]
+        + ["--target", str(tmp_path / "t.mmdb"), "--updates", str(updates)],
+        capture_output=True,
+        check=False,
+    )
+    assert result.returncode == 1
+    assert b"t.mmdb.ribstate" in result.stdout + result.stderr
+
+
+def test_save_load_state(tmp_path):
+    state = RibState()
+    state.table("peer b")
+    state.announce(0x0A000000, 8, 4, "peer a", ["1", "2"])
+    state.announce(0x0A000000, 8, 4, "peer b", ["3"])
+    state.announce(0x20010DB8 << 96, 32, 6, "peer a", ["4"])
+    state.withdraw(0x20010DB8 << 96, 32, 6, "peer a")
+    state.announce(0x14000000, 8, 4, "peer a", [])
+    fname = str(tmp_path / "target.mmdb")
+    assert save_state(fname, state)
+    loaded = load_state(fname)
+    assert loaded.peers == ["peer b", "peer a"]
+    assert list(loaded.best().items()) == [
+        (0x0A000000, 8, 4, ("3",)),
+        (0x14000000, 8, 4, ()),
+    ]
+    assert len(loaded) == 3